@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Submodules and the main classes are loaded on first use, so that
+`import updawg` stays cheap for short-lived jobs:
+
+import updawg
+
+pipeline = updawg.DataPipeline(...)     # imports updawg.components
+dag = updawg.DataDAG(...)               # imports updawg.utils.dag
+"""
+
+import importlib
+
+
+_SUBMODULES = ('components', 'utils', 'benchmarks')
+
+# name: submodule it is loaded from
+_LAZY_NAMES = {
+    'DataComponent': 'components',
+    'DataPipeline': 'components',
+    'DataManagerParallel': 'components',
+    'DataDAG': 'utils.dag',
+    'ExecutionPlan': 'utils.dag',
+    'WorkerPool': 'utils',
+    'map_parallel': 'utils',
+}
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+
+    if name in _LAZY_NAMES:
+        module = importlib.import_module(f'{__name__}.{_LAZY_NAMES[name]}')
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULES) | set(_LAZY_NAMES))
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the framework's own overhead (not for component work):
+
+    graph       NodeMapping construction (from a {node: NodeSet} dict and
+                from edge arrays) and find_cycles, on random DAGs of 10 to
+                100k nodes
+    edges       DiGraph edge insertion with online cycle checking
+    pipeline    DataPipeline dispatch cost per no-op component
+    fanout      DataManagerParallel / map_parallel fan-out over worker counts
+    imports     time to import updawg, updawg.components and updawg.utils.dag
+                in a fresh interpreter
+
+Nodes and edges are generated in topological order, which is the best case
+for keeping a topological order online, so graph.from_dict and
+edges.add_acyclic also have .shuffled variants that insert them in random
+order, and graph.from_dict.chain_reversed builds a chain sink first.
+
+Everything is synthetic and seeded, so runs are reproducible and need no
+data or network. Each benchmark reports the best of several repeats, in
+seconds.
+
+Usage (from the directory containing the updawg package):
+
+    python -m updawg.benchmarks.bench_framework --output results.json
+    python -m updawg.benchmarks.bench_framework --baseline \
+        updawg/benchmarks/baseline.json
+
+--save-baseline writes the results as the new baseline. With --baseline,
+benchmarks slower than the baseline by more than --threshold (default 1.25x,
+ignoring differences under --min-seconds) are reported as regressions, and
+the exit status is 1 if there are any.
+
+The imports group also checks each import against IMPORT_BUDGETS, and that
+it doesn't load any of DEFERRED_MODULES (which are only imported once a
+graph algorithm or coroutine needs them); the exit status is 1 if it does.
+tests/test_imports.py checks the same budgets under pytest.
+
+Timings only compare meaningfully on the same machine; baseline.json was
+recorded on a single-core Linux VM (see its "machine" entry).
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import random
+import subprocess
+import argparse
+import platform
+import datetime
+
+from updawg.components import DataComponent, DataPipeline, DataManagerParallel
+from updawg.utils import map_parallel
+from updawg.utils.dag import Node, NodeSet, NodeMapping, DiGraph
+
+
+GRAPH_SIZES = (10, 100, 1000, 10_000, 100_000)
+QUICK_GRAPH_SIZES = (10, 100, 1000, 10_000)
+
+WORKER_COUNTS = (1, 2, 4, 8)
+
+# seconds, with room for noise: about 3x what baseline.json records
+IMPORT_BUDGETS = {'updawg': 0.01,
+                  'updawg.components': 0.1,
+                  'updawg.utils.dag': 0.1}
+
+# not to be loaded by any of the imports in IMPORT_BUDGETS
+DEFERRED_MODULES = ('numpy', 'asyncio')
+
+_IMPORT_SCRIPT = '''
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [name for name in {deferred!r} if name in sys.modules]]))
+'''
+
+#%%
+def best_of(fn, repeats=5, setup=None):
+    '''
+    Best wall time of fn() over repeats calls (setup(), if given, is called
+    untimed before each one and its result is passed to fn). As with timeit,
+    garbage collection is off while timing.
+    '''
+    best = float('inf')
+
+    for _ in range(repeats):
+        args = () if setup is None else (setup(),)
+
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            fn(*args)
+            best = min(best, time.perf_counter() - start)
+        finally:
+            gc.enable()
+
+    return best
+
+
+def random_dag_edges(num_nodes, edges_per_node=2, seed=0):
+    '''
+    Random DAG edges (i -> j with i < j), about edges_per_node per node
+    '''
+    rng = random.Random(seed)
+    edges = set()
+
+    for _ in range(edges_per_node * (num_nodes - 1)):
+        i = rng.randrange(num_nodes - 1)
+        j = rng.randrange(i + 1, num_nodes)
+        edges.add((i, j))
+
+    return sorted(edges)
+
+
+def shuffled(items, seed=0):
+    items = list(items)
+    random.Random(seed).shuffle(items)
+
+    return items
+
+
+def node_dict(num_nodes, edges):
+    nodes = [Node(label=f'n{k}') for k in range(num_nodes)]
+
+    mapping = {node: NodeSet() for node in nodes}
+    for i, j in edges:
+        mapping[nodes[i]].add(nodes[j])
+
+    return mapping
+
+
+class NoOp(DataComponent):
+    def run(self, *args, **kwargs):
+        return self.inputs
+
+
+def _identity(inputs):
+    return inputs
+
+
+def measure_import(module):
+    '''
+    Import module in a fresh interpreter and return (seconds taken, the
+    DEFERRED_MODULES it loaded)
+    '''
+    # the directory containing the updawg package
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+
+    # timed as imports usually are, from the bytecode cache
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in env.get('PYTHONPATH', '').split(os.pathsep) if p])
+
+    script = _IMPORT_SCRIPT.format(module=module, deferred=DEFERRED_MODULES)
+    output = subprocess.run([sys.executable, '-c', script], env=env,
+                            capture_output=True, text=True, check=True).stdout
+
+    seconds, loaded = json.loads(output)
+    return seconds, loaded
+
+#%%
+def bench_graph(results, sizes, repeats):
+    for n in sizes:
+        edges = random_dag_edges(n)
+        src = [i for i, _ in edges]
+        dst = [j for _, j in edges]
+
+        reps = repeats if n <= 10_000 else max(1, repeats // 3)
+
+        mapping = node_dict(n, edges)
+        results[f'graph.from_dict.{n}'] = best_of(
+            lambda: NodeMapping(mapping), reps)
+
+        shuffled_mapping = dict(shuffled(mapping.items()))
+        results[f'graph.from_dict.{n}.shuffled'] = best_of(
+            lambda: NodeMapping(shuffled_mapping), reps)
+
+        chain = node_dict(n, [(k, k + 1) for k in range(n - 1)])
+        reversed_chain = dict(reversed(list(chain.items())))
+        results[f'graph.from_dict.{n}.chain_reversed'] = best_of(
+            lambda: NodeMapping(reversed_chain), reps)
+
+        results[f'graph.from_edges.{n}'] = best_of(
+            lambda: NodeMapping.from_edges(src, dst, labels=range(n)), reps)
+
+        results[f'graph.find_cycles.{n}'] = best_of(
+            lambda m: m.find_cycles(), reps,
+            setup=lambda: NodeMapping.from_edges(src, dst))
+
+
+def bench_edges(results, sizes, repeats):
+    for n in sizes:
+        if n > 10_000:
+            continue
+
+        for order in ('sorted', 'shuffled'):
+            edges = random_dag_edges(n)
+            indices = range(n)
+            suffix = ''
+
+            if order == 'shuffled':
+                edges = shuffled(edges)
+                indices = shuffled(indices)
+                suffix = '.shuffled'
+
+            def setup():
+                graph = DiGraph()
+                nodes = [Node(label=f'n{k}') for k in range(n)]
+                for k in indices:
+                    graph.node_mapping.add_node(nodes[k])
+                return graph, nodes
+
+            def add_edges(state):
+                graph, nodes = state
+                for i, j in edges:
+                    graph.add_children(node=nodes[i], children=[nodes[j]])
+
+            elapsed = best_of(add_edges, repeats, setup=setup)
+            results[f'edges.add_acyclic.{n}{suffix}'] = elapsed
+            results[f'edges.add_acyclic.{n}{suffix}.per_edge'] = (
+                elapsed / len(edges))
+
+
+def bench_pipeline(results, repeats, num_components=200):
+    pipeline = DataPipeline(*[NoOp() for _ in range(num_components)])
+    pipeline.inputs = 0
+
+    elapsed = best_of(pipeline.run, repeats)
+    results[f'pipeline.run.{num_components}'] = elapsed
+    results['pipeline.per_component'] = elapsed / num_components
+
+
+def bench_fanout(results, repeats, num_components=64):
+    for backend in ('thread', 'process'):
+        for workers in WORKER_COUNTS:
+            manager = DataManagerParallel(*[NoOp() for _ in range(num_components)],
+                                          backend=backend, max_workers=workers)
+            manager.inputs = 0
+
+            results[f'fanout.manager.{backend}.{workers}'] = best_of(
+                manager.run, repeats)
+
+        results[f'fanout.map_parallel.{backend}.{WORKER_COUNTS[-1]}'] = best_of(
+            lambda: map_parallel(0, [_identity] * num_components,
+                                 backend=backend,
+                                 max_workers=WORKER_COUNTS[-1]),
+            repeats)
+
+
+def bench_imports(results, repeats):
+    for module in IMPORT_BUDGETS:
+        # the first import may also write the bytecode cache
+        measure_import(module)
+
+        results[f'imports.{module}'] = min(measure_import(module)[0]
+                                           for _ in range(repeats))
+
+
+def import_problems(results):
+    '''
+    Return a list of messages for the imports that are over their budget in
+    results, or that load any of DEFERRED_MODULES
+    '''
+    problems = []
+
+    for module, budget in IMPORT_BUDGETS.items():
+        seconds = results.get(f'imports.{module}')
+        if seconds is not None and seconds > budget:
+            problems.append(f'import {module} took {seconds:.4f} s '
+                            f'(budget {budget} s)')
+
+        _, loaded = measure_import(module)
+        if loaded:
+            problems.append(f'import {module} loads {", ".join(loaded)}')
+
+    return problems
+
+
+BENCHMARKS = dict(graph=bench_graph, edges=bench_edges, pipeline=bench_pipeline,
+                  fanout=bench_fanout, imports=bench_imports)
+
+#%%
+def run_benchmarks(names=None, quick=False, repeats=5):
+    '''
+    Run the named benchmark groups (default: all) and return
+    {benchmark: seconds}
+    '''
+    sizes = QUICK_GRAPH_SIZES if quick else GRAPH_SIZES
+    results = {}
+
+    for name in names or BENCHMARKS:
+        bench = BENCHMARKS[name]
+
+        if name in ('graph', 'edges'):
+            bench(results, sizes, repeats)
+        else:
+            bench(results, repeats)
+
+    return results
+
+
+def machine_info():
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+
+    return dict(python=platform.python_version(),
+                platform=platform.platform(),
+                machine=platform.machine(),
+                cpu_count=os.cpu_count(),
+                numpy=numpy_version,
+                date=datetime.datetime.now().isoformat(timespec='seconds'))
+
+
+def compare(results, baseline, threshold=1.25, min_seconds=1e-3):
+    '''
+    Return a list of (benchmark, seconds, baseline seconds, ratio, slower)
+    for the benchmarks in both, and the subset that are slower: more than
+    threshold x baseline, and by more than min_seconds (sub-millisecond
+    timings are too noisy to flag on their own)
+    '''
+    rows = []
+    for key, seconds in results.items():
+        if key not in baseline:
+            continue
+
+        base = baseline[key]
+        ratio = seconds / base
+        slower = ratio > threshold and seconds - base > min_seconds
+
+        rows.append((key, seconds, base, ratio, slower))
+
+    regressions = [row for row in rows if row[4]]
+    return rows, regressions
+
+
+def format_comparison(rows):
+    lines = [f'{"benchmark":<40s}{"now s":>12s}{"baseline s":>12s}{"ratio":>8s}']
+
+    for key, seconds, base, ratio, slower in rows:
+        flag = '  <-- slower' if slower else ''
+        lines.append(f'{key:<40s}{seconds:>12.6f}{base:>12.6f}{ratio:>8.2f}{flag}')
+
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('benchmarks', nargs='*',
+                        help=f'benchmark groups to run: {", ".join(BENCHMARKS)} '
+                             '(default: all)')
+    parser.add_argument('--quick', action='store_true',
+                        help='skip the largest graphs')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against this JSON file')
+    parser.add_argument('--save-baseline', metavar='PATH',
+                        help='write the results as a baseline to PATH')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown ratio reported as a regression')
+    parser.add_argument('--min-seconds', type=float, default=1e-3,
+                        help='smallest slowdown (in seconds) reported as a '
+                             'regression')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+
+    results = run_benchmarks(args.benchmarks, quick=args.quick,
+                             repeats=args.repeats)
+    report = dict(machine=machine_info(), results=results)
+
+    for key, seconds in results.items():
+        print(f'{key:<40s}{seconds:>12.6f}')
+
+    for path in (args.output, args.save_baseline):
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=1)
+
+    status = 0
+
+    if 'imports' in (args.benchmarks or BENCHMARKS):
+        problems = import_problems(results)
+        for problem in problems:
+            print(problem)
+        if problems:
+            status = 1
+
+    if args.baseline is None:
+        return status
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+
+    rows, regressions = compare(results, baseline, args.threshold,
+                                args.min_seconds)
+
+    print()
+    print(format_comparison(rows))
+
+    if regressions:
+        print(f'\n{len(regressions)} benchmark(s) slower than '
+              f'{args.threshold}x baseline')
+        return 1
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
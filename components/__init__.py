@@ -1,2 +1,5 @@
 from .bases import *
 from .managers import *
+from .caching import *
+from .datacache import *
+from .spilling import *
\ No newline at end of file
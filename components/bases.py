@@ -64,8 +64,14 @@ all be subclasses of DataComponent, which add (resp.) .extract, .process, and
 
 import abc
 import copy
+import functools
+import collections.abc
 
 import updawg.utils.common as common
+import updawg.utils.resources as resources
+import updawg.utils.profiling as profiling
+import updawg.components.caching as caching
+import updawg.components.spilling as spilling
 
 #%%
 
@@ -99,10 +105,18 @@ class PrettyReprBaseClass:
 class DataReference():
     '''
     Mutable data container that can be used as a pointer
+
+    If the value has been spilled to disk (see spilling.py), reading it loads
+    it back.
     '''
     @property
     def value(self):
-        return self._value[0]
+        value = self._value[0]
+
+        if isinstance(value, spilling.SpilledValue):
+            return value.load()
+
+        return value
 
     @value.setter
     def value(self, value):
@@ -122,10 +136,79 @@ class DataReference():
         self._value = other._value
 
 #%%
+def _tracks_configure(configure):
+    '''
+    Wrap a .configure method so that calling it marks the component dirty
+    (see DataComponent.is_dirty), and so that calls made after __init__
+    update ._configuration (which is part of the caching fingerprint): the
+    positional args of the latest call that had any, and the kwargs of all
+    calls merged
+    '''
+    @functools.wraps(configure)
+    def wrapper(self, *args, **kwargs):
+        # super().configure calls inside a configure override aren't recorded
+        outermost = not self.__dict__.get('_configuring', False)
+        self._configuring = True
+
+        try:
+            result = configure(self, *args, **kwargs)
+        finally:
+            if outermost:
+                self._configuring = False
+
+        if outermost:
+            # lets copies of the component (see WorkerPool.warm) tell that
+            # they are out of date
+            self._config_version = self.__dict__.get('_config_version', 0) + 1
+
+            if self.__dict__.get('_initialized', False):
+                config_args, config_kwargs = self._configuration
+                self._configuration = (args or config_args,
+                                       {**config_kwargs,
+                                        **copy.deepcopy(kwargs)})
+
+            self._dirty = True
+            self.resources = resources.declared_resources(self)
+
+        return result
+
+    wrapper._tracks_configure = True
+    return wrapper
+
+
 class DataComponent(PrettyReprBaseClass):
     '''
     Base class for other data analysis classes
     '''
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        configure = cls.__dict__.get('configure')
+        if configure is not None and not hasattr(configure, '_tracks_configure'):
+            cls.configure = _tracks_configure(configure)
+
+    # whether a streaming DataPipeline can run this component once per chunk
+    streamable = True
+
+    # whether results can be reused from a ResultCache (see caching.py); set
+    # this to False for components that aren't deterministic
+    cacheable = True
+    result_cache = None
+
+    # whether runs with release=True keep this component's outputs after its
+    # consumers have finished with them
+    keep_outputs = False
+
+    # name of the component's node in a DataDAG, which is also the key of its
+    # outputs in the inputs of a node with several parents (default: the
+    # class name and a count, e.g. Add_0, Add_1)
+    label = None
+
+    # what one run needs, for resource-aware scheduling (see utils.resources)
+    cores = 1
+    memory_bytes = 0
+    exclusive_io = False
+
     @property
     def inputs(self):
         return self._inputs.value
@@ -143,20 +226,191 @@ class DataComponent(PrettyReprBaseClass):
         self._outputs.value = value
 
 
+    @property
+    def is_dirty(self):
+        '''
+        True if the component has never run, or has been reconfigured since
+        it last ran (used by incremental runs)
+        '''
+        return self._dirty
+
+    def mark_dirty(self):
+        self._dirty = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self._inputs = DataReference()
         self._outputs = DataReference()
 
+        self._dirty = True
+        self._input_fingerprint = None
+        self._configuration = (self._args, dict(self._kwargs))
+
         self.configure(*args, **kwargs)
+        self._initialized = True
 
+    @_tracks_configure
     def configure(self, *args, **kwargs):
         pass
 
     def run(self, *args, **kwargs):
         pass
 
+    async def arun(self, *args, **kwargs):
+        '''
+        Coroutine version of run, used by DataPipeline.arun and DataDAG.arun.
+
+        By default this runs .run in a worker thread, so it doesn't block the
+        event loop. Components that mostly wait on I/O can override it with a
+        native async implementation instead.
+        '''
+        import asyncio
+        return await asyncio.to_thread(self.run, *args, **kwargs)
+
+    def combine_chunks(self, chunks):
+        '''
+        Merge the chunks of a streaming DataPipeline into one input, for
+        components with streamable = False. Override this to e.g. pd.concat.
+        '''
+        return chunks
+
+    def __call__(self, inputs, *args, **kwargs):
+        '''
+        Run the component on inputs and return its outputs
+        (see run_component)
+        '''
+        return run_component(self, inputs, *args, **kwargs)
+
+
+def run_component(component, inputs, *args, **kwargs):
+    '''
+    Set component.inputs, call component.run, and return component.outputs
+
+    If .run returns something other than None, that becomes the outputs.
+    This is a module-level function so that it can be sent to a process pool
+    along with a (pickled) component.
+
+    If a result cache is in use (see caching.py) and already holds the
+    outputs for this component and inputs, .run isn't called.
+    '''
+    return run_bound(component, component.run, inputs, args, kwargs)
+
+
+def run_bound(component, run, inputs, args=(), kwargs=None):
+    '''
+    run_component, with component's run method already looked up (see
+    DataDAG.compile)
+    '''
+    profiler = profiling.active_profiler()
+
+    if profiler is not None:
+        return profiler.call(component, inputs, _run_bound, component, run,
+                             inputs, args, kwargs)
+
+    return _run_bound(component, run, inputs, args, kwargs)
+
+
+def _run_bound(component, run, inputs, args, kwargs):
+    kwargs = kwargs or {}
+    component.inputs = inputs
+
+    cache, key, found, outputs = caching.lookup(component, inputs, args, kwargs)
+    if found:
+        component.outputs = outputs
+        return outputs
+
+    result = run(*args, **kwargs)
+
+    if result is not None:
+        component.outputs = result
+
+    # an iterator (from a streaming component) can only be consumed once
+    if key is not None and not isinstance(component.outputs,
+                                          collections.abc.Iterator):
+        cache.put(key, component.outputs)
+
+    return component.outputs
+
+
+async def arun_component(component, inputs, *args, **kwargs):
+    '''
+    Coroutine version of run_component, awaiting component.arun
+    '''
+    profiler = profiling.active_profiler()
+    coroutine = _arun_component(component, inputs, args, kwargs)
+
+    if profiler is not None:
+        return await profiler.acall(component, inputs, coroutine)
+
+    return await coroutine
+
+
+async def _arun_component(component, inputs, args, kwargs):
+    component.inputs = inputs
+
+    cache, key, found, outputs = caching.lookup(component, inputs, args, kwargs)
+    if found:
+        component.outputs = outputs
+        return outputs
+
+    result = await component.arun(*args, **kwargs)
+
+    if result is not None:
+        component.outputs = result
+
+    # an iterator (from a streaming component) can only be consumed once
+    if key is not None and not isinstance(component.outputs,
+                                          collections.abc.Iterator):
+        cache.put(key, component.outputs)
+
+    return component.outputs
+
+def needs_rerun(component, inputs, args=(), kwargs=None, check_inputs=True):
+    '''
+    Whether an incremental run has to rerun component: it is dirty, or (with
+    check_inputs) its inputs or run arguments differ from its last run
+    '''
+    if getattr(component, 'is_dirty', True):
+        return True
+
+    if not check_inputs:
+        return False
+
+    fingerprint = caching.input_fingerprint(inputs, args, kwargs)
+
+    return fingerprint is None or fingerprint != component._input_fingerprint
+
+
+def mark_clean(component, inputs, args=(), kwargs=None, check_inputs=True):
+    '''
+    Record a successful run of component for later needs_rerun checks
+    '''
+    if check_inputs:
+        fingerprint = caching.input_fingerprint(inputs, args, kwargs)
+    else:
+        fingerprint = None
+
+    component._input_fingerprint = fingerprint
+    component._dirty = False
+
+
+def release_outputs(component):
+    '''
+    Drop component.outputs to free the memory, unless component.keep_outputs
+    is set. The component is marked dirty, so that an incremental run
+    recomputes the outputs.
+
+    Returns True if the outputs were released
+    '''
+    if getattr(component, 'keep_outputs', False):
+        return False
+
+    component.outputs = None
+    component.mark_dirty()
+
+    return True
+
 #%%
 class DataComponentList(list):
     def __init__(self, *args, **kwargs):
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Opt-in memoization of DataComponent results.
+
+A component's result is looked up by a fingerprint of its class, the
+arguments it was constructed with (PrettyReprBaseClass._args/_kwargs) and
+any later .configure calls, the arguments passed to .run and its inputs. On
+a hit, .outputs is filled from the cache and .run isn't called.
+
+Usage:
+
+cache = ResultCache(max_bytes=2**30)
+
+with using_result_cache(cache):
+    pipeline.run()
+
+print(cache.stats())
+
+A cache can also be attached to a single component (component.result_cache
+= cache). Components that aren't deterministic should set cacheable = False.
+Cached outputs are shared, not copied, so they should be treated as
+read-only.
+"""
+
+import sys
+import pickle
+import hashlib
+import threading
+import contextlib
+import collections
+
+import updawg.utils.common as common
+
+
+_MISSING = object()
+
+
+class ResultCache:
+    '''
+    In-memory LRU cache of component outputs, bounded by the estimated size
+    of the cached values (see common.estimate_nbytes).
+
+    store is an optional second tier, e.g. a DataCache: results are also
+    written there, and looked up there on a memory miss. Since a DataCache is
+    a directory, it is shared by every process (and later run) that uses it;
+    errors reading or writing the store count as misses rather than failing
+    the run.
+    Pickling a ResultCache (e.g. to send a component to a process pool)
+    keeps the settings and store but not the in-memory entries.
+    '''
+    def __init__(self, max_bytes=256 * 2**20, store=None):
+        self.max_bytes = max_bytes
+        self.store = store
+
+        self.hits = 0
+        self.misses = 0
+        self.store_hits = 0
+        self.nbytes = 0
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return dict(max_bytes=self.max_bytes, store=self.store)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def lookup(self, key):
+        '''
+        Return (True, value) if key is cached, else (False, None)
+        '''
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                value, _ = self._entries[key]
+                return True, value
+
+        value = self._store_lookup(key)
+
+        if value is not _MISSING:
+            self._put_memory(key, value)
+
+            with self._lock:
+                self.hits += 1
+                self.store_hits += 1
+
+            return True, value
+
+        with self._lock:
+            self.misses += 1
+
+        return False, None
+
+    def _store_lookup(self, key):
+        if self.store is None:
+            return _MISSING
+
+        try:
+            return self.store[key]
+        except (KeyError, OSError):
+            return _MISSING
+
+    def put(self, key, value):
+        self._put_memory(key, value)
+
+        if self.store is not None:
+            try:
+                self.store[key] = value
+            except (pickle.PicklingError, TypeError, AttributeError,
+                    OSError):
+                pass
+
+    def _put_memory(self, key, value):
+        nbytes = common.estimate_nbytes(value)
+
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+
+            while self.nbytes > self.max_bytes:
+                _, (_, old_nbytes) = self._entries.popitem(last=False)
+                self.nbytes -= old_nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        return dict(hits=self.hits,
+                    misses=self.misses,
+                    store_hits=self.store_hits,
+                    entries=len(self._entries),
+                    nbytes=self.nbytes,
+                    max_bytes=self.max_bytes)
+
+    def __repr__(self):
+        cls = self.__class__.__name__
+        return f'{cls}(max_bytes={self.max_bytes}, store={self.store})'
+
+
+_result_cache = None
+
+
+def set_result_cache(cache):
+    '''
+    Use cache for every cacheable component that doesn't have its own
+    result_cache (None turns this off). Returns the previous cache.
+    '''
+    global _result_cache
+
+    previous = _result_cache
+    _result_cache = cache
+
+    return previous
+
+
+@contextlib.contextmanager
+def using_result_cache(cache):
+    previous = set_result_cache(cache)
+    try:
+        yield cache
+    finally:
+        set_result_cache(previous)
+
+
+def cache_for(component):
+    if not getattr(component, 'cacheable', False):
+        return None
+
+    cache = getattr(component, 'result_cache', None)
+    if cache is None:
+        cache = _result_cache
+
+    return cache
+
+
+def _update_hash(hasher, obj):
+    np = sys.modules.get('numpy')
+
+    if (np is not None and isinstance(obj, np.ndarray)
+            and not obj.dtype.hasobject):
+        hasher.update(repr((obj.dtype.str, obj.shape)).encode())
+        hasher.update(np.ascontiguousarray(obj).data)
+        return
+
+    hasher.update(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def fingerprint(component, inputs, args=(), kwargs=None):
+    '''
+    Hex digest identifying a run of component on inputs, or None if some part
+    of it can't be hashed (e.g. isn't picklable)
+    '''
+    config = _component_config(component) + (args, kwargs or {})
+
+    hasher = hashlib.sha256()
+
+    try:
+        _update_hash(hasher, config)
+        _update_hash(hasher, inputs)
+    except Exception:
+        return None
+
+    return hasher.hexdigest()
+
+
+def _component_config(component):
+    cls = component.__class__
+    config_args, config_kwargs = getattr(component, '_configuration',
+                                         (component._args, component._kwargs))
+
+    return (f'{cls.__module__}.{cls.__qualname__}',
+            _config_value(config_args), _config_value(config_kwargs))
+
+
+def _config_value(value):
+    '''
+    value, with any components in it (e.g. a DataPipeline's) replaced by
+    their own configuration, so that their inputs and outputs aren't hashed
+    '''
+    if hasattr(value, '_configuration'):
+        return _component_config(value)
+
+    if isinstance(value, (list, tuple)):
+        return [_config_value(val) for val in value]
+
+    if isinstance(value, dict):
+        return {key: _config_value(val) for key, val in value.items()}
+
+    return value
+
+
+def component_fingerprint(component):
+    '''
+    Hex digest identifying component by its class and configuration alone
+    (not its inputs). If the configuration can't be hashed, only the class
+    is used.
+    '''
+    config = _component_config(component)
+
+    hasher = hashlib.sha256()
+
+    try:
+        _update_hash(hasher, config)
+    except Exception:
+        hasher = hashlib.sha256(config[0].encode())
+
+    return hasher.hexdigest()
+
+
+def input_fingerprint(inputs, args=(), kwargs=None):
+    '''
+    Hex digest of inputs and run arguments alone, or None if they can't be
+    hashed
+    '''
+    hasher = hashlib.sha256()
+
+    try:
+        _update_hash(hasher, (args, kwargs or {}))
+        _update_hash(hasher, inputs)
+    except Exception:
+        return None
+
+    return hasher.hexdigest()
+
+
+def lookup(component, inputs, args, kwargs):
+    '''
+    Return (cache, key, found, outputs) for a run of component on inputs;
+    cache and key are None if the run can't be cached
+    '''
+    cache = cache_for(component)
+    if cache is None:
+        return None, None, False, None
+
+    key = fingerprint(component, inputs, args, kwargs)
+    if key is None:
+        return None, None, False, None
+
+    found, outputs = cache.lookup(key)
+    return cache, key, found, outputs
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DataCache: a dictionary-like store of component outputs in a local directory.
+
+Each entry is a subdirectory holding the value in a binary columnar format:
+
+    NumPy array             data.npy
+    dict of arrays          c0.npy, c1.npy, ... (+ frame.pkl with the keys)
+    pandas DataFrame        c0.npy, c1.npy, ... (+ frame.pkl with the column
+                            names and index)
+    anything else           data.pkl
+
+plus meta.json with the entry's key and kind. Entries are written to a
+temporary directory and renamed into place, and old entries are renamed
+out of the way before they are deleted, so processes sharing a directory
+see either a whole entry or none. Arrays are read back
+memory-mapped and read-only, so opening a multi-GB intermediate costs a few
+page-table entries rather than a copy. Columns with object dtype are pickled.
+
+A DataCache can also back a ResultCache (ResultCache(store=DataCache(...))),
+which shares results between processes and across runs.
+"""
+
+import os
+import re
+import errno
+import sys
+import json
+import pickle
+import shutil
+import hashlib
+import tempfile
+import collections.abc
+
+
+# keys that can be used as directory names as they are; others are hashed.
+# The first character can't be a dot, so names like '..' and the working
+# directories (.tmp-*, .old-*) can't be keys
+_SAFE_KEY = re.compile(r'\w[\w.-]{0,99}')
+
+
+def _is_plain_array(obj):
+    np = sys.modules.get('numpy')
+
+    return (np is not None and isinstance(obj, np.ndarray)
+            and not obj.dtype.hasobject)
+
+
+def _is_dataframe(obj):
+    pd = sys.modules.get('pandas')
+
+    return pd is not None and isinstance(obj, pd.DataFrame)
+
+
+def _save_pickle(path, obj):
+    with open(path, 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _load_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _save_column(directory, idx, column):
+    if _is_plain_array(column):
+        import numpy as np
+        np.save(os.path.join(directory, f'c{idx}.npy'), column)
+    else:
+        _save_pickle(os.path.join(directory, f'c{idx}.pkl'), column)
+
+
+def _load_column(directory, idx, mmap_mode):
+    path = os.path.join(directory, f'c{idx}.npy')
+
+    if os.path.exists(path):
+        import numpy as np
+        return np.load(path, mmap_mode=mmap_mode)
+
+    return _load_pickle(os.path.join(directory, f'c{idx}.pkl'))
+
+
+class DataCache(collections.abc.MutableMapping):
+    '''
+    Dictionary-like store of values under directory; see the module docstring
+    for the format. With mmap=False, arrays are read into memory instead of
+    being memory-mapped.
+    '''
+    def __init__(self, directory, mmap=True):
+        self.directory = os.path.abspath(directory)
+        self.mmap = mmap
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __repr__(self):
+        cls = self.__class__.__name__
+        return f'{cls}({self.directory!r})'
+
+    def _entry_dir(self, key):
+        key = str(key)
+
+        if _SAFE_KEY.fullmatch(key):
+            name = key
+        else:
+            name = hashlib.sha256(key.encode()).hexdigest()
+
+        return os.path.join(self.directory, name)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self._entry_dir(key), 'meta.json'))
+
+    def __setitem__(self, key, value):
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.directory)
+
+        try:
+            kind = self._write(tmp_dir, value)
+
+            meta = dict(key=str(key), kind=kind)
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+
+            entry_dir = self._entry_dir(key)
+
+            while True:
+                self._discard(entry_dir)
+                try:
+                    os.replace(tmp_dir, entry_dir)
+                    break
+                except OSError as exc:
+                    # another process stored the key since the discard
+                    if exc.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                        raise
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def _discard(self, entry_dir):
+        '''
+        Delete entry_dir, if it exists, and return whether it did. It is
+        renamed away first, so the entry is gone at once for readers even
+        while its files are being deleted.
+        '''
+        trash_dir = tempfile.mkdtemp(prefix='.old-', dir=self.directory)
+
+        try:
+            os.replace(entry_dir, os.path.join(trash_dir, 'entry'))
+            return True
+        except FileNotFoundError:
+            return False
+        finally:
+            shutil.rmtree(trash_dir, ignore_errors=True)
+
+    def _write(self, directory, value):
+        if _is_plain_array(value):
+            import numpy as np
+            np.save(os.path.join(directory, 'data.npy'), value)
+            return 'array'
+
+        if isinstance(value, dict) and any(_is_plain_array(val)
+                                           for val in value.values()):
+            for idx, column in enumerate(value.values()):
+                _save_column(directory, idx, column)
+
+            _save_pickle(os.path.join(directory, 'frame.pkl'),
+                         dict(keys=list(value)))
+            return 'columns'
+
+        if _is_dataframe(value):
+            for idx, key in enumerate(value.columns):
+                _save_column(directory, idx, value[key].to_numpy())
+
+            _save_pickle(os.path.join(directory, 'frame.pkl'),
+                         dict(keys=list(value.columns), index=value.index))
+            return 'dataframe'
+
+        _save_pickle(os.path.join(directory, 'data.pkl'), value)
+        return 'pickle'
+
+    def __getitem__(self, key):
+        try:
+            return self._read(self._entry_dir(key))
+        except FileNotFoundError:
+            # missing, or removed by another process while being read
+            raise KeyError(key) from None
+
+    def _read(self, entry_dir):
+        with open(os.path.join(entry_dir, 'meta.json')) as f:
+            meta = json.load(f)
+
+        kind = meta['kind']
+        mmap_mode = 'r' if self.mmap else None
+
+        if kind == 'array':
+            import numpy as np
+            return np.load(os.path.join(entry_dir, 'data.npy'),
+                           mmap_mode=mmap_mode)
+
+        if kind == 'pickle':
+            return _load_pickle(os.path.join(entry_dir, 'data.pkl'))
+
+        frame = _load_pickle(os.path.join(entry_dir, 'frame.pkl'))
+        columns = {key: _load_column(entry_dir, idx, mmap_mode)
+                   for idx, key in enumerate(frame['keys'])}
+
+        if kind == 'columns':
+            return columns
+
+        import pandas as pd
+        return pd.DataFrame(columns, index=frame['index'], copy=False)
+
+    def __delitem__(self, key):
+        if not self._discard(self._entry_dir(key)):
+            raise KeyError(key)
+
+    def __iter__(self):
+        for name in sorted(os.listdir(self.directory)):
+            # entries being written or deleted
+            if name.startswith('.'):
+                continue
+
+            meta_path = os.path.join(self.directory, name, 'meta.json')
+
+            try:
+                with open(meta_path) as f:
+                    yield json.load(f)['key']
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            shutil.rmtree(os.path.join(self.directory, name),
+                          ignore_errors=True)
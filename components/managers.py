@@ -7,13 +7,22 @@ Created on Thu Jan  2 19:07:47 2020
 """
 
 
+import queue
+import threading
+import contextlib
+import collections.abc
+
 import updawg.components.bases as bases
+import updawg.components.spilling as spilling
 from updawg.utils import map_parallel
 
 #%%
 
 class DataManagerBase(bases.DataComponent):
 
+    # the components are cached individually
+    cacheable = False
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.components = bases.DataComponentList()
@@ -21,15 +30,75 @@ class DataManagerBase(bases.DataComponent):
 
 
 class DataManagerParallel(DataManagerBase):
+    '''
+    Runs each of its components on the same inputs, in parallel, and sets
+    .outputs to the list of component outputs (in component order)
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for arg in args:
+            if isinstance(arg, bases.DataComponent):
+                self.components.append(arg)
+
+    def configure(self, *args, backend='thread', max_workers=None,
+                  chunksize=1, pool=None, share_inputs=None,
+                  resource_budget=None, **kwargs):
+        '''
+        backend is 'thread', 'process' or 'serial' (see map_parallel).
+
+        pool is an optional WorkerPool to run on instead; the components are
+        then sent to its workers once, rather than on every run.
+
+        share_inputs controls whether large array inputs are handed to
+        process workers through shared memory (default: whenever the workers
+        are processes).
+
+        resource_budget (a ResourceBudget, or True for the whole machine)
+        makes the components start only when their declared cores and memory
+        fit (see utils.resources).
+        '''
+        self.backend = backend
+        self.max_workers = max_workers
+        self.chunksize = chunksize
+        self.pool = pool
+        self.share_inputs = share_inputs
+        self.resource_budget = resource_budget
 
     def run(self, *args, **kwargs):
-        funcs_for_loop = [cmpt.run for cmpt in self.components]
+        functions = self.components
+        if self.pool is not None:
+            functions = [self.pool.warm(cmpt) for cmpt in self.components]
 
-        outputs = map_parallel(inputs=self._inputs,
-                               functions=funcs_for_loop)
+        outputs = map_parallel(inputs=self.inputs,
+                               functions=functions,
+                               args=args,
+                               backend=self.backend,
+                               max_workers=self.max_workers,
+                               chunksize=self.chunksize,
+                               executor=self.pool,
+                               share_inputs=self.share_inputs,
+                               resource_budget=self.resource_budget,
+                               **kwargs)
+
+        # with a process pool, the components here never saw their outputs
+        for component, output in zip(self.components, outputs):
+            component.outputs = output
 
         self.outputs = outputs
 
+    async def arun(self, *args, **kwargs):
+        '''
+        Coroutine version of run: all components run concurrently on the
+        event loop (see DataComponent.arun)
+        '''
+        import asyncio
+
+        coroutines = [bases.arun_component(cmpt, self.inputs, *args, **kwargs)
+                      for cmpt in self.components]
+
+        self.outputs = list(await asyncio.gather(*coroutines))
+
 class DataPipeline(DataManagerBase):
 
     def __init__(self, *args, **kwargs):
@@ -49,12 +118,220 @@ class DataPipeline(DataManagerBase):
         self._inputs.point_to(self.components[0]._inputs)
         self._outputs.point_to(self.components[-1]._outputs)
 
-    def run(self, *args, **kwargs):
+    def configure(self, *args, streaming=False, threaded=False, queue_size=2,
+                  **kwargs):
+        '''
+        With streaming=True, run() passes data through the pipeline chunk by
+        chunk (see stream).
+
+        With threaded=True (which implies streaming), each component runs in
+        its own thread, and consecutive components are connected by queues
+        holding at most queue_size chunks, so stages overlap but a slow stage
+        makes the ones before it wait rather than pile up chunks.
+        '''
+        self.streaming = streaming or threaded
+        self.threaded = threaded
+        self.queue_size = queue_size
+
+    def run(self, *args, incremental=False, release=False, memory_budget=None,
+            **kwargs):
         '''
         Assumes that component.run sets its .outputs at the end
+
+        With incremental=True, components whose outputs from the previous run
+        are still valid are skipped: a component is rerun only if it is
+        dirty (never run, or reconfigured), if the pipeline inputs or run
+        arguments changed (for the first component), or if anything before
+        it was rerun. Not used in streaming mode.
+
+        With release=True, each intermediate output is dropped as soon as the
+        next component has run, so only one intermediate result is held at a
+        time. The last component's outputs, and those of components with
+        keep_outputs set, are kept.
+
+        memory_budget (a number of bytes, or a spilling.MemoryBudget) caps
+        the memory held by intermediate outputs: past it, the oldest ones are
+        spilled to disk, and read back if they are needed again.
+        '''
+        if self.streaming:
+            self.outputs = list(self.stream(*args, **kwargs))
+            return
+
+        budget = spilling.as_budget(memory_budget)
+        rerun = False
+
+        for idx, component in enumerate(self.components):
+            inputs = component.inputs
+            is_first = idx == 0
+
+            if incremental and not rerun:
+                rerun = bases.needs_rerun(component, inputs, args, kwargs,
+                                          check_inputs=is_first)
+                if not rerun:
+                    continue
+
+            bases.run_component(component, inputs, *args, **kwargs)
+            bases.mark_clean(component, inputs, args, kwargs,
+                             check_inputs=incremental and is_first)
+
+            if release and not is_first:
+                bases.release_outputs(self.components[idx - 1])
+
+            if budget is not None:
+                if not is_first:
+                    budget.add(self.components[idx - 1]._outputs)
+                budget.add(component._outputs)
+
+    async def arun(self, *args, **kwargs):
         '''
+        Coroutine version of run, awaiting each component's arun in turn
+        '''
+        for component in self.components:
+            await bases.arun_component(component, component.inputs,
+                                       *args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        '''
+        Generator that runs the pipeline one chunk at a time, yielding the
+        last component's outputs for each chunk.
+
+        A component emits chunks by returning an iterator (e.g. from a
+        generator function) from .run; each chunk is then passed through the
+        downstream components before the next one is read, so only a chunk
+        at a time needs to be in memory. A component that returns anything
+        else emits a single chunk.
+
+        A component with .streamable = False needs all of its data at once:
+        it gets component.combine_chunks(list_of_chunks) as its inputs.
+        '''
+        if self.threaded:
+            yield from self._threaded_stream(args, kwargs)
+            return
+
+        chunks = iter([self.inputs])
+
         for component in self.components:
-            component.run(*args, **kwargs)
+            chunks = _stream_component(component, chunks, args, kwargs)
+
+        yield from chunks
+
+    def _threaded_stream(self, args, kwargs):
+        in_queue = queue.Queue()
+        in_queue.put(self.inputs)
+        in_queue.put(_END)
+
+        stop = threading.Event()
+        errors = []
+        threads = []
+
+        with _unlinked(self.components):
+            for component in self.components:
+                out_queue = queue.Queue(maxsize=self.queue_size)
+
+                thread = threading.Thread(target=_run_stage,
+                                          args=(component, in_queue, out_queue,
+                                                stop, errors, args, kwargs),
+                                          name=repr(component),
+                                          daemon=True)
+                thread.start()
+
+                threads.append(thread)
+                in_queue = out_queue
+
+            try:
+                yield from _drain(in_queue, stop)
+            finally:
+                # also reached if the caller stops iterating early
+                stop.set()
+                for thread in threads:
+                    thread.join()
+
+        if errors:
+            raise errors[0]
+
+
+_END = object()
+_POLL_SECONDS = 0.05
+
+
+def _put(out_queue, item, stop):
+    '''
+    Block until item is queued (returns True) or stop is set (returns False)
+    '''
+    while True:
+        try:
+            out_queue.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            if stop.is_set():
+                return False
+
+
+def _drain(in_queue, stop):
+    '''
+    Yield items from in_queue until the end marker arrives or stop is set
+    '''
+    while True:
+        try:
+            item = in_queue.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            if stop.is_set():
+                return
+            continue
+
+        if item is _END:
+            return
+
+        yield item
+
+
+def _run_stage(component, in_queue, out_queue, stop, errors, args, kwargs):
+    try:
+        chunks = _drain(in_queue, stop)
+
+        for result in _stream_component(component, chunks, args, kwargs):
+            if not _put(out_queue, result, stop):
+                return
+    except Exception as exc:
+        errors.append(exc)
+        stop.set()
+    finally:
+        _put(out_queue, _END, stop)
+
+
+@contextlib.contextmanager
+def _unlinked(components):
+    '''
+    Give each component its own input/output references for the duration,
+    so that stages running in different threads don't overwrite each other's
+    chunks through the links made by connect_components
+    '''
+    links = [(cmpt._inputs, cmpt._outputs) for cmpt in components]
+
+    for cmpt in components:
+        cmpt._inputs = bases.DataReference()
+        cmpt._outputs = bases.DataReference()
+
+    try:
+        yield
+    finally:
+        for cmpt, (inputs, outputs) in zip(components, links):
+            last_outputs = cmpt.outputs
+            cmpt._inputs, cmpt._outputs = inputs, outputs
+            cmpt.outputs = last_outputs
+
+
+def _stream_component(component, chunks, args, kwargs):
+    if not component.streamable:
+        chunks = [component.combine_chunks(list(chunks))]
+
+    for chunk in chunks:
+        result = bases.run_component(component, chunk, *args, **kwargs)
+
+        if isinstance(result, collections.abc.Iterator):
+            yield from result
+        else:
+            yield result
 
 
 
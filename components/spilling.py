@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Running under a memory budget by spilling component outputs to disk.
+
+A MemoryBudget tracks the DataReferences holding component outputs during a
+DataPipeline or DataDAG run, together with the (estimated) size of each value.
+When the total goes over max_bytes, the least recently needed values are
+written to a DataCache in a scratch directory, and the DataReference is left
+holding a SpilledValue. Reading DataReference.value (e.g. a consumer's
+.inputs) loads a spilled value back from disk; arrays come back memory-mapped,
+so reloading them doesn't count against the budget until they are used.
+
+A job whose intermediates don't fit in memory then runs slower instead of
+being killed.
+"""
+
+import shutil
+import weakref
+import tempfile
+import itertools
+import threading
+import collections
+
+import updawg.utils.common as common
+from updawg.components.datacache import DataCache
+
+
+class SpilledValue:
+    '''
+    Placeholder for a value that a MemoryBudget has written to disk
+    '''
+    def __init__(self, budget, key, nbytes):
+        self.budget = budget
+        self.key = key
+        self.nbytes = nbytes
+
+    def __repr__(self):
+        cls = self.__class__.__name__
+        return f'{cls}({self.key!r}, nbytes={self.nbytes})'
+
+    def load(self):
+        return self.budget.store[self.key]
+
+
+class MemoryBudget:
+    '''
+    Keeps the outputs held in memory during a run under max_bytes, by
+    spilling the least recently needed ones to directory (a new temporary
+    directory by default, removed along with the budget)
+    '''
+    def __init__(self, max_bytes, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+
+        self.nbytes = 0
+        self.num_spilled = 0
+
+        self._store = None
+        self._keys = itertools.count()
+        self._lock = threading.Lock()
+
+        # id(reference) -> (reference, id(value), nbytes), least recent first
+        self._resident = collections.OrderedDict()
+
+    def __repr__(self):
+        cls = self.__class__.__name__
+        return f'{cls}({self.max_bytes})'
+
+    @property
+    def store(self):
+        if self._store is None:
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix='updawg-spill-')
+                weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+            self._store = DataCache(self.directory)
+
+        return self._store
+
+    def add(self, reference):
+        '''
+        Track the value held by reference (a DataReference) as the most
+        recently needed one, and spill older values if over budget
+        '''
+        value = reference._value[0]
+        if value is None or isinstance(value, SpilledValue):
+            return
+
+        with self._lock:
+            entry = self._resident.pop(id(reference), None)
+
+            if entry is not None and entry[1] == id(value):
+                nbytes = entry[2]
+            else:
+                if entry is not None:
+                    self.nbytes -= entry[2]
+                nbytes = common.estimate_nbytes(value)
+                self.nbytes += nbytes
+
+            self._resident[id(reference)] = (reference, id(value), nbytes)
+
+            self._spill_to_budget()
+
+    def discard(self, reference, value):
+        '''
+        Stop tracking reference, whose value was value before it was
+        released, and delete value from disk if it was spilled
+        '''
+        with self._lock:
+            entry = self._resident.pop(id(reference), None)
+            if entry is not None:
+                self.nbytes -= entry[2]
+
+        if isinstance(value, SpilledValue) and value.budget is self:
+            try:
+                del self.store[value.key]
+            except KeyError:
+                pass
+
+    def touch(self, reference):
+        '''
+        Mark reference's value as just needed, so it is spilled last
+        '''
+        with self._lock:
+            if id(reference) in self._resident:
+                self._resident.move_to_end(id(reference))
+
+    def _spill_to_budget(self):
+        # the most recently added value is about to be used, so it stays
+        while self.nbytes > self.max_bytes and len(self._resident) > 1:
+            key = next(iter(self._resident))
+            reference, value_id, nbytes = self._resident.pop(key)
+            self.nbytes -= nbytes
+
+            value = reference._value[0]
+
+            # released or replaced since it was added
+            if value is None or id(value) != value_id:
+                continue
+
+            self._spill(reference, value, nbytes)
+
+    def _spill(self, reference, value, nbytes):
+        key = f'spill-{next(self._keys)}'
+
+        try:
+            self.store[key] = value
+        except Exception:
+            # e.g. unpicklable; it has to stay in memory
+            return
+
+        reference.value = SpilledValue(self, key, nbytes)
+        self.num_spilled += 1
+
+
+def as_budget(memory_budget):
+    '''
+    Return memory_budget as a MemoryBudget (it may also be a number of bytes,
+    or None for no budget)
+    '''
+    if memory_budget is None or isinstance(memory_budget, MemoryBudget):
+        return memory_budget
+
+    return MemoryBudget(memory_budget)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Makes this checkout importable as updawg, whatever the checkout directory is
+called. It is put on sys.path before the test modules are collected, so they
+can define components at module level (which process workers need in order
+to unpickle them).
+"""
+
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _import_path():
+    '''
+    A directory from which this checkout imports as updawg
+    '''
+    if os.path.basename(ROOT) == 'updawg':
+        return os.path.dirname(ROOT)
+
+    directory = tempfile.mkdtemp(prefix='updawg-path-')
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    os.symlink(ROOT, os.path.join(directory, 'updawg'))
+
+    return directory
+
+
+sys.path.insert(0, _import_path())
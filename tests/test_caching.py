@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ResultCache: hits for repeated runs, misses when the inputs or configuration
+change, the DataCache second tier, and components that opt out with
+cacheable = False.
+"""
+
+from updawg.components import (DataComponent, ResultCache, DataCache,
+                               using_result_cache)
+from updawg.utils.dag import DataDAG
+
+
+calls = []
+
+
+class Scale(DataComponent):
+    def configure(self, factor=2):
+        self.factor = factor
+
+    def run(self, **kwargs):
+        calls.append('scale')
+        return self.inputs * self.factor
+
+
+class Counter(DataComponent):
+    cacheable = False
+
+    def run(self, **kwargs):
+        calls.append('counter')
+        return len(calls)
+
+
+def setup_function():
+    calls.clear()
+
+
+def test_repeated_run_hits():
+    component = Scale()
+    component.result_cache = cache = ResultCache()
+
+    assert component(3) == 6
+    assert component(3) == 6
+
+    assert calls == ['scale']
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_changed_inputs_or_configuration_miss():
+    component = Scale()
+    component.result_cache = cache = ResultCache()
+
+    component(3)
+    component(4)
+    component.configure(factor=3)
+    assert component(3) == 9
+
+    assert calls == ['scale'] * 3
+    assert cache.stats()['hits'] == 0
+
+
+def test_dag_run_hits_with_global_cache():
+    cache = ResultCache()
+
+    with using_result_cache(cache):
+        for _ in range(2):
+            dag = DataDAG({Scale(factor=2): [Scale(factor=5)]})
+            dag.set_inputs(1)
+            outputs = dag.run(backend='serial')
+
+    assert calls == ['scale', 'scale']
+    assert sorted(outputs.values()) == [2, 10]
+    assert cache.stats()['hits'] == 2
+
+
+def test_store_shared_between_caches(tmp_path):
+    store = DataCache(str(tmp_path))
+
+    first = Scale()
+    first.result_cache = ResultCache(store=store)
+    first(3)
+
+    second = Scale()
+    second.result_cache = cache = ResultCache(store=store)
+
+    assert second(3) == 6
+    assert calls == ['scale']
+    assert cache.stats()['store_hits'] == 1
+
+
+def test_cacheable_false_opts_out():
+    component = Counter()
+    component.result_cache = cache = ResultCache()
+
+    with using_result_cache(cache):
+        assert [component(None) for _ in range(3)] == [1, 2, 3]
+
+    assert len(cache) == 0
+    assert cache.stats()['hits'] == cache.stats()['misses'] == 0
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DataDAG.run (failures, targets, release, incremental runs, backends and
+memory budgets) and the graph edits underneath it (cycle checks, and editing
+a graph built by from_edges).
+"""
+
+import pytest
+
+from updawg.components import DataComponent, MemoryBudget
+from updawg.utils.dag import (DataDAG, DAGExecutionError, DiGraph, CycleError,
+                              Node, NodeSet)
+
+
+# components are defined here rather than in the tests, so that process
+# workers can unpickle them
+
+calls = []
+
+
+class Source(DataComponent):
+    def configure(self, value=0):
+        self.value = value
+
+    def run(self, **kwargs):
+        calls.append(self.label)
+        return self.value
+
+
+class Add(DataComponent):
+    def configure(self, amount=1):
+        self.amount = amount
+
+    def run(self, **kwargs):
+        calls.append(self.label)
+
+        if isinstance(self.inputs, dict):
+            return sum(self.inputs.values()) + self.amount
+
+        return self.inputs + self.amount
+
+
+class Fail(DataComponent):
+    def run(self, **kwargs):
+        raise ValueError('failed on purpose')
+
+
+class Block(DataComponent):
+    '''
+    1 MB of bytes, all equal to value
+    '''
+    def configure(self, value=0):
+        self.value = value
+
+    def run(self, **kwargs):
+        return bytes([self.value]) * 2**20
+
+
+def labelled(component, label):
+    component.label = label
+    return component
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    calls.clear()
+
+
+def diamond():
+    '''
+    src -> left, right -> sink, returning (dag, components by label)
+    '''
+    src = labelled(Source(value=1), 'src')
+    left = labelled(Add(amount=10), 'left')
+    right = labelled(Add(amount=100), 'right')
+    sink = labelled(Add(amount=0), 'sink')
+
+    dag = DataDAG({src: [left, right], left: [sink], right: [sink]})
+
+    return dag, dict(src=src, left=left, right=right, sink=sink)
+
+
+def chain(*components):
+    return DataDAG({parent: [child] for parent, child
+                    in zip(components, components[1:])})
+
+
+#%%
+@pytest.mark.parametrize('backend', ['serial', 'thread', 'process'])
+def test_run_backends(backend):
+    dag, components = diamond()
+
+    outputs = dag.run(backend=backend, max_workers=2)
+
+    assert outputs[dag.node_for('left')] == 11
+    assert outputs[dag.node_for('right')] == 101
+    assert outputs[dag.node_for('sink')] == 112
+
+    # results from process workers are copied back into the components
+    assert components['sink'].outputs == 112
+
+
+def test_run_failure_skips_descendants():
+    src = labelled(Source(value=1), 'src')
+    fail = labelled(Fail(), 'fail')
+    after_fail = labelled(Add(), 'after_fail')
+    other = labelled(Add(), 'other')
+
+    dag = DataDAG({src: [fail, other], fail: [after_fail]})
+
+    with pytest.raises(DAGExecutionError) as info:
+        dag.run(backend='serial')
+
+    error = info.value
+    assert list(error.failures) == [dag.node_for('fail')]
+    assert isinstance(error.failures[dag.node_for('fail')], ValueError)
+
+    # independent branches still run; nothing downstream of the failure does
+    assert error.outputs[dag.node_for('other')] == 2
+    assert dag.node_for('after_fail') not in error.outputs
+    assert 'after_fail' not in calls
+
+
+def test_run_targets():
+    dag, _ = diamond()
+
+    outputs = dag.run(backend='serial', targets=['left'])
+
+    assert set(outputs) == {dag.node_for('src'), dag.node_for('left')}
+    assert sorted(calls) == ['left', 'src']
+
+
+def test_run_release():
+    dag, components = diamond()
+
+    outputs = dag.run(backend='serial', release=True, keep=['left'])
+
+    assert set(outputs) == {dag.node_for('left'), dag.node_for('sink')}
+    assert outputs[dag.node_for('sink')] == 112
+
+    assert components['src'].outputs is None
+    assert components['right'].outputs is None
+    assert components['left'].outputs == 11
+
+
+def test_run_incremental():
+    dag, components = diamond()
+
+    dag.run(backend='serial', incremental=True)
+    calls.clear()
+
+    outputs = dag.run(backend='serial', incremental=True)
+    assert calls == []
+    assert outputs[dag.node_for('sink')] == 112
+
+    components['right'].configure(amount=200)
+    outputs = dag.run(backend='serial', incremental=True)
+
+    assert sorted(calls) == ['right', 'sink']
+    assert outputs[dag.node_for('sink')] == 212
+
+
+def test_multi_parent_inputs_keyed_by_label():
+    dag, components = diamond()
+
+    dag.run(backend='serial')
+
+    assert components['sink'].inputs == {'left': 11, 'right': 101}
+
+
+#%%
+def test_spill_and_reload_under_memory_budget(tmp_path):
+    blocks = [Block(value=i) for i in range(6)]
+    dag = chain(*blocks)
+
+    budget = MemoryBudget(int(2.5 * 2**20), directory=str(tmp_path))
+    outputs = dag.run(backend='serial', memory_budget=budget)
+
+    assert budget.num_spilled > 0
+    assert any(outputs.is_spilled(node) for node in outputs)
+
+    for i, block in enumerate(blocks):
+        assert bytes(outputs[dag.node_for(block)]) == bytes([i]) * 2**20
+
+
+def test_release_deletes_spilled_outputs(tmp_path):
+    src = Block(value=0)
+    fan = [Block(value=i) for i in range(1, 5)]
+    sink = Block(value=5)
+
+    dag = DataDAG({src: fan, **{block: [sink] for block in fan}})
+
+    budget = MemoryBudget(int(2.5 * 2**20), directory=str(tmp_path))
+    outputs = dag.run(backend='serial', memory_budget=budget, release=True)
+
+    assert budget.num_spilled > 0
+    assert list(outputs) == [dag.node_for(sink)]
+    assert list(budget.store) == []
+
+
+#%%
+def test_add_children_raises_cycle_error():
+    a, b, c = Node(label='a'), Node(label='b'), Node(label='c')
+    graph = DiGraph({a: NodeSet(b), b: NodeSet(c)})
+
+    with pytest.raises(CycleError):
+        graph.add_children(node=c, children=[a])
+
+    # the offending edge isn't added
+    assert a not in graph.node_mapping.children(c)
+    assert not graph.has_cycles()
+
+
+def test_from_edges_editing():
+    graph = DiGraph.from_edges([0, 1], [1, 2], labels=['a', 'b', 'c'])
+    node_mapping = graph.node_mapping
+    a, b, c = (node_mapping.node(idx) for idx in range(3))
+
+    # an empty batch on a frozen mapping keeps its edges
+    with graph.batch():
+        pass
+    assert node_mapping.num_edges == 2
+
+    d = Node(label='d')
+    graph.add_children(node=c, children=[d])
+    graph.remove_children(node=a, children=[b])
+
+    assert node_mapping.num_edges == 2
+    assert node_mapping.children(c) == NodeSet(d)
+    assert b not in node_mapping.children(a)
+
+    with pytest.raises(CycleError):
+        graph.add_children(node=d, children=[b])
+
+    order = list(node_mapping.topological_order())
+    assert order.index(b) < order.index(c) < order.index(d)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Import-time budget: importing the package and its main modules has to stay
+within benchmarks.bench_framework.IMPORT_BUDGETS, and mustn't load NumPy or
+asyncio (see DEFERRED_MODULES). Each import is timed in a fresh
+interpreter.
+"""
+
+import pytest
+
+
+MODULES = ('updawg', 'updawg.components', 'updawg.utils.dag')
+
+
+@pytest.fixture(scope='module')
+def bench():
+    # conftest.py puts this checkout on sys.path as updawg
+    import updawg.benchmarks.bench_framework as bench
+    return bench
+
+
+@pytest.mark.parametrize('module', MODULES)
+def test_import_time(bench, module):
+    # the first import may also write the bytecode cache
+    bench.measure_import(module)
+
+    seconds = min(bench.measure_import(module)[0] for _ in range(3))
+
+    assert seconds <= bench.IMPORT_BUDGETS[module]
+
+
+@pytest.mark.parametrize('module', MODULES)
+def test_import_defers_heavy_modules(bench, module):
+    _, loaded = bench.measure_import(module)
+
+    assert loaded == []
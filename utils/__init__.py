@@ -1,2 +1,4 @@
 from .looping import *
-from .common import *
\ No newline at end of file
+from .common import *
+from .workers import *
+from .profiling import *
\ No newline at end of file
@@ -6,6 +6,8 @@ Created on Thu Jan  2 22:54:03 2020
 @author: dh
 """
 
+import sys
+import pickle
 import functools
 
 def obj_iter_to_str(obj_list, iter_type=list):
@@ -44,4 +46,27 @@ def is_hashable(obj):
     else:
         output = True
 
-    return output
\ No newline at end of file
+    return output
+
+
+def estimate_nbytes(obj):
+    '''
+    Rough size of obj in bytes: exact for NumPy arrays and pandas objects,
+    the pickled size for other picklable objects, and sys.getsizeof otherwise
+    '''
+    nbytes = getattr(obj, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+
+    # pandas DataFrame
+    memory_usage = getattr(obj, 'memory_usage', None)
+    if callable(memory_usage):
+        try:
+            return int(memory_usage(deep=True).sum())
+        except (TypeError, AttributeError):
+            pass
+
+    try:
+        return len(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(obj)
@@ -6,14 +6,23 @@ Created on Fri Dec 27 11:23:23 2019
 @author: dh
 """
 
-import numpy as np
+import os
+import time
+import threading
 import functools
-
-import importlib
-
-import updawg.utils.bases as bases
-
-importlib.reload(bases)
+import itertools
+import contextlib
+import collections
+import collections.abc
+import concurrent.futures
+
+import updawg.components.bases as bases
+import updawg.components.spilling as spilling
+import updawg.utils.looping as looping
+import updawg.utils.workers as workers
+import updawg.utils.scheduling as scheduling
+import updawg.utils.resources as resources
+import updawg.utils.profiling as profiling
 
 #%%
 def obj_iter_to_str(obj_list, iter_type=list):
@@ -108,8 +117,8 @@ class Node(bases.PrettyReprBaseClass):
 
     def connect_to_object(self, obj, callback=None):
         '''
-        Connect node to an object so that the specified object method
-        gets called
+        Connect node to an object, and optionally look up the named object
+        method as node.callback
         '''
         self.obj = obj
 
@@ -117,102 +126,597 @@ class Node(bases.PrettyReprBaseClass):
             return
 
         try:
-            self.callback = obj.__getattribute__(callback)
+            self.callback = getattr(obj, callback)
         except (AttributeError, TypeError):
             return
 
-        # Probably shouldn't do this, but... trying to shoehorn the
-        # object's callback method name into this class's namespace
-        if callback not in self.__dict__:
-            self.__dict__[callback] = self.callback
-
 
 #%%
+class CycleError(ValueError):
+    '''
+    Raised when adding an edge would make an acyclic graph cyclic
+    '''
+    def __init__(self, parent, child):
+        self.parent = parent
+        self.child = child
+
+        super().__init__(f'edge {parent} -> {child} would create a cycle')
+
+
 class NodeMapping(bases.PrettyReprBaseClass):
+    '''
+    Directed graph of Node objects, built from a {node: NodeSet(children)}
+    dict.
+
+    Nodes are numbered in the order they are first seen, and edges are kept
+    as per-index sets of child and parent indices, so adding or removing an
+    edge is O(1). The compressed sparse index arrays, cycle check and
+    topological order are derived from those sets on demand and cached until
+    the next edit.
+
+    Once a topological order is known, it is maintained online as edges are
+    added with acyclic=True (see _order_edge), so those edits can be checked
+    without rescanning the graph. Bulk construction, and plain edges added
+    inside a batch, drop the order instead; it is found again with Kahn's
+    algorithm the next time it is needed.
+
+    A mapping built by from_edges starts out "frozen": edges live only in the
+    sparse index arrays and Node objects are created the first time they are
+    asked for. The per-index sets are filled in on the first edit.
+    '''
 
     def __init__(self, node_mapping, **kwargs):
         bases.PrettyReprBaseClass.__init__(self, node_mapping, **kwargs)
 
         assert isinstance(node_mapping, dict)
 
-        tmp_dict = {}
-
-        for key, val in node_mapping.items():
-            assert isinstance(key, Node)
-            assert isinstance(val, NodeSet)
+        self._init_state()
 
-            tmp_dict[key] = val
+        with self.batch():
+            for key, val in node_mapping.items():
+                assert isinstance(key, Node)
+                assert isinstance(val, NodeSet)
 
-        self._dict = tmp_dict
+                self.add_node(key)
+                for child_node in val:
+                    self.add_edge(key, child_node)
 
+    def _init_state(self, labels=None):
         self.num_nodes = 0
-        self._all_nodes = NodeSet()
         self._node_indices = {}
-        self.adj_matrix = np.zeros([0,0], dtype=int)
+        self._index_nodes = []
+        self._labels = labels
+        self._child_sets = []
+        self._parent_sets = []
+        self._batch_depth = 0
 
-        self.update()
+        # position of each node index in a topological order, or None if the
+        # graph has cycles (or hasn't been checked yet)
+        self._ord = []
 
-    def update(self):
-        self._count_all_nodes()
-        self._map_nodes_to_indices()
-        self._create_adjacency_matrix()
+        self._clear_derived()
+
+    @classmethod
+    def from_edges(cls, src, dst=None, labels=None):
+        '''
+        Build a mapping from integer edge arrays: there is an edge from node
+        src[k] to node dst[k]. src can instead be an iterable of
+        (parent, child) pairs, with dst left as None.
+
+        Nodes are numbered 0..n-1, where n is len(labels) if labels are given
+        and max index + 1 otherwise. The sparse index arrays are built in one
+        vectorized pass; Node objects are only created when they are asked
+        for, via .node(idx) or by iterating over the mapping.
+        '''
+        import numpy as np
+
+        if dst is None:
+            edges = np.asarray(list(src), dtype=np.int64).reshape(-1, 2)
+            src, dst = edges[:,0], edges[:,1]
+
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+
+        assert src.ndim == 1 and src.shape == dst.shape
+        assert src.size == 0 or min(src.min(), dst.min()) >= 0
+
+        if labels is not None:
+            n = len(labels)
+        elif src.size:
+            n = int(max(src.max(), dst.max())) + 1
+        else:
+            n = 0
+
+        assert src.size == 0 or max(src.max(), dst.max()) < n
+
+        # np.unique sorts by (src, dst) and drops repeated edges, which is
+        # exactly the CSR layout
+        edge_keys = np.unique(src * n + dst)
+        src, dst = np.divmod(edge_keys, max(n, 1))
 
-    def _count_all_nodes(self):
-        all_nodes = NodeSet()
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+        parent_indptr, parent_indices = cls._compress(dst, src, n)
 
-        for node, child_nodes in self._dict.items():
-            all_nodes.add(node)
-            for child_node in child_nodes:
-                all_nodes.add(child_node)
+        self = cls.__new__(cls)
+        bases.PrettyReprBaseClass.__init__(self)
 
-        self._all_nodes = all_nodes
-        self.num_nodes = len(all_nodes)
+        self._init_state(labels=labels)
+        self.num_nodes = n
+        self._index_nodes = [None] * n
+        self._child_sets = None
+        self._parent_sets = None
+        self._ord = None
+        self._csr = (indptr, dst, parent_indptr, parent_indices)
 
-    def _map_nodes_to_indices(self):
-        for idx, node in enumerate(self._all_nodes):
+        return self
+
+    def node(self, idx):
+        '''
+        Return the Node at index idx, creating it if the mapping was built by
+        from_edges and it hasn't been asked for yet
+        '''
+        node = self._index_nodes[idx]
+
+        if node is None:
+            if self._labels is None:
+                node = Node()
+            else:
+                node = Node(label=self._labels[idx])
+
+            self._index_nodes[idx] = node
             self._node_indices[node] = idx
 
-    def _create_adjacency_matrix(self):
+        return node
+
+    def _thaw(self):
+        '''
+        Fill in the per-index edge sets from the sparse index arrays, so that
+        a mapping built by from_edges can be edited
+        '''
+        if self._child_sets is not None:
+            return
+
+        indptr, indices, parent_indptr, parent_indices = self._csr
+
+        self._child_sets = self._index_sets(indptr, indices)
+        self._parent_sets = self._index_sets(parent_indptr, parent_indices)
+
+    @staticmethod
+    def _index_sets(indptr, indices):
+        indptr = indptr.tolist()
+        indices = indices.tolist()
+
+        return [set(indices[start:stop])
+                for start, stop in zip(indptr[:-1], indptr[1:])]
+
+    def _clear_derived(self):
+        self._cycle_nodes = None
+
+        # Compressed sparse row (children) and column (parents) index
+        # arrays: the children of node i are _indices[_indptr[i]:_indptr[i+1]].
+        # Until a mapping built by from_edges is thawed, they are the only
+        # copy of its edges, so they are kept.
+        if self._child_sets is not None:
+            self._csr = None
+
+    def _edited(self):
+        if self._batch_depth == 0:
+            self._clear_derived()
+
+    @contextlib.contextmanager
+    def batch(self):
+        '''
+        Context manager for bulk edits: derived data is only invalidated once,
+        when the outermost batch exits
+        '''
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            self._edited()
+
+    def __contains__(self, node):
+        return node in self._node_indices
+
+    def __iter__(self):
+        for idx in range(self.num_nodes):
+            yield self.node(idx)
+
+    def __len__(self):
+        return self.num_nodes
+
+    def __getitem__(self, node):
+        return self.children(node)
+
+    def items(self):
+        for node in self:
+            yield node, self.children(node)
+
+    @property
+    def nodes(self):
+        return list(self)
+
+    @property
+    def num_edges(self):
+        if self._child_sets is None:
+            return len(self._csr[1])
+
+        return sum(len(child_set) for child_set in self._child_sets)
+
+    @property
+    def adj_matrix(self):
+        '''
+        Dense adjacency matrix, materialized from the sparse index arrays on
+        every access. Only use this for small graphs.
+        '''
+        import numpy as np
+
+        indptr, indices, _, _ = self.update()
+
         n = self.num_nodes
         A = np.zeros([n,n], dtype=int)
 
-        for node, child_nodes in self._dict.items():
-            i = self._node_indices[node]
+        rows = np.repeat(np.arange(n), np.diff(indptr))
+        np.add.at(A, (rows, indices), 1)
 
-            for child_node in child_nodes:
-                j = self._node_indices[child_node]
+        return A
 
-                A[i,j] += 1
+    def add_node(self, node):
+        '''
+        Add node if it isn't already in the mapping, and return its index
+        '''
+        idx = self._node_indices.get(node)
+        if idx is not None:
+            return idx
 
-        self.adj_matrix = A
+        assert isinstance(node, Node)
 
+        self._thaw()
 
-    def find_cycles(self):
+        idx = self.num_nodes
+        self._node_indices[node] = idx
+        self._index_nodes.append(node)
+        self._child_sets.append(set())
+        self._parent_sets.append(set())
+        self.num_nodes += 1
+
+        if self._ord is not None:
+            self._ord.append(idx)
+
+        self._edited()
+        return idx
+
+    def add_edge(self, parent, child, acyclic=False):
+        '''
+        Add an edge from parent to child. With acyclic=True, raise CycleError
+        instead of adding an edge that would create a cycle.
+
+        The check is incremental as long as the graph is acyclic; if the graph
+        already has a cycle, no order can be kept and the check is skipped.
+        Without acyclic, an edge added inside a batch doesn't update the
+        order: it is dropped, and found again when it's next needed.
+        '''
+        self._thaw()
+
+        i = self.add_node(parent)
+        j = self.add_node(child)
+
+        if j in self._child_sets[i]:
+            return
+
+        if acyclic and self._ord is None:
+            self._cycle_nodes = None
+            self._analyze()
+
+        if not acyclic and self._batch_depth > 0:
+            self._ord = None
+        elif self._ord is not None and not self._order_edge(i, j):
+            if acyclic:
+                raise CycleError(parent, child)
+
+            self._ord = None
+
+        self._child_sets[i].add(j)
+        self._parent_sets[j].add(i)
+
+        self._edited()
+
+    def remove_edge(self, parent, child):
+        i = self._node_indices.get(parent)
+        j = self._node_indices.get(child)
+
+        if i is None or j is None:
+            return
+
+        self._thaw()
+
+        self._child_sets[i].discard(j)
+        self._parent_sets[j].discard(i)
+
+        self._edited()
+
+    def child_indices(self, idx):
+        indptr, indices, _, _ = self.update()
+        return indices[indptr[idx]:indptr[idx+1]]
+
+    def parent_indices(self, idx):
+        _, _, indptr, indices = self.update()
+        return indices[indptr[idx]:indptr[idx+1]]
+
+    def _index_node_set(self, node, index_sets, index_func):
+        idx = self._node_indices.get(node)
+
+        if idx is None:
+            return NodeSet()
+
+        if index_sets is None:
+            neighbors = index_func(idx).tolist()
+        else:
+            neighbors = index_sets[idx]
+
+        return NodeSet(*[self.node(j) for j in neighbors])
+
+    def children(self, node):
+        return self._index_node_set(node, self._child_sets, self.child_indices)
+
+    def parents(self, node):
+        return self._index_node_set(node, self._parent_sets,
+                                    self.parent_indices)
+
+    def update(self):
+        '''
+        Rebuild the compressed sparse index arrays if the graph has been
+        edited, and return (indptr, indices, parent_indptr, parent_indices)
+        '''
+        if self._csr is None:
+            self._csr = self._create_sparse_adjacency()
+
+        return self._csr
+
+    @staticmethod
+    def _compress(major, minor, n):
+        '''
+        Sort (major, minor) index pairs by major index and return the
+        (indptr, indices) arrays of the compressed representation
         '''
-        Taking powers of adjacency matrix gives number of paths of given length
-        between nodes. Taking geometric series gives total number of paths.
-        If resulting sum has non-zeros on diagonal, then there are cycles.
+        import numpy as np
+
+        order = np.lexsort((minor, major))
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(major, minlength=n), out=indptr[1:])
+
+        return indptr, minor[order]
+
+    def _create_sparse_adjacency(self):
+        import numpy as np
+
+        n = self.num_nodes
+        degrees = [len(child_set) for child_set in self._child_sets]
+
+        src = np.repeat(np.arange(n, dtype=np.int64), degrees)
+        dst = np.fromiter(itertools.chain.from_iterable(self._child_sets),
+                          dtype=np.int64, count=len(src))
+
+        indptr, indices = self._compress(src, dst, n)
+        parent_indptr, parent_indices = self._compress(dst, src, n)
+
+        return indptr, indices, parent_indptr, parent_indices
+
+    def _child_index_lists(self):
+        if self._child_sets is None:
+            indptr, indices, _, _ = self._csr
+            indptr = indptr.tolist()
+            indices = indices.tolist()
+
+            return [indices[start:stop]
+                    for start, stop in zip(indptr[:-1], indptr[1:])]
+
+        return [list(child_set) for child_set in self._child_sets]
+
+    def _strongly_connected_components(self):
         '''
+        Tarjan's algorithm, O(nodes + edges). Written with an explicit stack
+        so that long chains don't hit the recursion limit.
 
+        Components are returned (as lists of node indices) in reverse
+        topological order.
+        '''
+        adjacency = self._child_index_lists()
         n = self.num_nodes
-        A = self.adj_matrix
-        P = np.eye(n, dtype=int)
-        T = np.zeros(A.shape, dtype=int)
 
-        for _ in range(n):
-            P = P @ A
-            T += P
+        index = [-1] * n
+        low = [0] * n
+        on_stack = [False] * n
+        stack = []
+        components = []
+        counter = 0
+
+        for root in range(n):
+            if index[root] >= 0:
+                continue
+
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [(root, iter(adjacency[root]))]
+
+            while work:
+                v, child_iter = work[-1]
+
+                for w in child_iter:
+                    if index[w] < 0:
+                        index[w] = low[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack[w] = True
+                        work.append((w, iter(adjacency[w])))
+                        break
+                    elif on_stack[w]:
+                        low[v] = min(low[v], index[w])
+                else:
+                    work.pop()
+                    if work:
+                        u = work[-1][0]
+                        low[u] = min(low[u], low[v])
+
+                    if low[v] == index[v]:
+                        component = []
+                        while True:
+                            w = stack.pop()
+                            on_stack[w] = False
+                            component.append(w)
+                            if w == v:
+                                break
+                        components.append(component)
+
+        return components, adjacency
+
+    def _analyze(self):
+        '''
+        Find a topological order with Kahn's algorithm, or, if there is none,
+        the cycle members with Tarjan's. Cycle members are cached until the
+        next edit; the order is kept up to date by add_edge, or dropped by
+        bulk edits and found again here.
+        '''
+        if self._ord is not None or self._cycle_nodes is not None:
+            return
 
-        diag = T.diagonal()
+        ord_ = self._kahn_order()
+        if ord_ is not None:
+            self._ord = ord_
+            return
 
-        if not any(diag):
+        components, adjacency = self._strongly_connected_components()
+
+        cycle_idx = []
+        for component in components:
+            v = component[0]
+            if len(component) > 1 or v in adjacency[v]:
+                cycle_idx.extend(component)
+
+        self._cycle_nodes = [self.node(idx) for idx in cycle_idx]
+
+    def _kahn_order(self):
+        '''
+        Kahn's algorithm, O(nodes + edges): repeatedly take nodes with no
+        remaining parents. Returns the position of each node index in the
+        resulting order, or None if some nodes are left over (i.e. the graph
+        has cycles).
+        '''
+        adjacency = self._child_index_lists()
+        n = self.num_nodes
+
+        in_degree = [0] * n
+        for child_list in adjacency:
+            for j in child_list:
+                in_degree[j] += 1
+
+        ready = [idx for idx in range(n) if in_degree[idx] == 0]
+        ord_ = [0] * n
+        pos = 0
+
+        while ready:
+            v = ready.pop()
+            ord_[v] = pos
+            pos += 1
+
+            for w in adjacency[v]:
+                in_degree[w] -= 1
+                if in_degree[w] == 0:
+                    ready.append(w)
+
+        if pos < n:
             return None
 
-        idx_cycle = np.argwhere(diag > 0).flatten()
-        ind = self._node_indices
+        return ord_
 
-        cycle_nodes = [node for node, idx in ind.items() if idx in idx_cycle]
-        return cycle_nodes
+    def _order_edge(self, i, j):
+        '''
+        Keep the topological order valid for a new edge i -> j, using the
+        Pearce-Kelly algorithm: if j already comes after i nothing changes,
+        otherwise only the nodes whose positions lie between those of j and i
+        are visited and shuffled.
+
+        Returns False, leaving the order untouched, if the edge would close a
+        cycle.
+        '''
+        ord_ = self._ord
+
+        if i == j:
+            return False
+
+        lower = ord_[j]
+        upper = ord_[i]
+        if lower > upper:
+            return True
+
+        # nodes reachable from j that currently sit before i
+        forward = {j}
+        stack = [j]
+        while stack:
+            v = stack.pop()
+            for w in self._child_sets[v]:
+                if w == i:
+                    return False
+                if w not in forward and ord_[w] < upper:
+                    forward.add(w)
+                    stack.append(w)
+
+        # nodes that reach i and currently sit after j
+        backward = {i}
+        stack = [i]
+        while stack:
+            v = stack.pop()
+            for w in self._parent_sets[v]:
+                if w not in backward and ord_[w] > lower:
+                    backward.add(w)
+                    stack.append(w)
+
+        # ancestors of i take the lowest of the freed positions, then the
+        # descendants of j, each group keeping its relative order
+        moved = (sorted(backward, key=ord_.__getitem__)
+                 + sorted(forward, key=ord_.__getitem__))
+        positions = sorted(ord_[v] for v in moved)
+
+        for v, pos in zip(moved, positions):
+            ord_[v] = pos
+
+        return True
+
+    def find_cycles(self):
+        '''
+        Return the nodes that are part of a cycle (None if there are none).
+
+        Nodes in a strongly connected component with more than one member, or
+        with an edge to itself, are on a cycle.
+        '''
+        self._analyze()
+
+        if self._ord is not None:
+            return None
+
+        return list(self._cycle_nodes)
+
+    def topological_order(self):
+        '''
+        Return a list of all nodes such that every parent comes before its
+        children. Raises ValueError if the graph has cycles.
+        '''
+        self._analyze()
+
+        if self._ord is None:
+            cycle_str = obj_list_to_str(self._cycle_nodes)
+            raise ValueError(f'graph has cycles through {cycle_str}')
+
+        order = [None] * self.num_nodes
+        for idx, pos in enumerate(self._ord):
+            order[pos] = self.node(idx)
+
+        return order
 
 
 
@@ -250,74 +754,73 @@ def tmp():
 class DiGraph(bases.PrettyReprBaseClass):
 
     def __init__(self, node_mapping=None, **kwargs):
+        if node_mapping is None:
+            node_mapping = {}
+
         self.node_mapping = NodeMapping(node_mapping)
 
+    @classmethod
+    def from_edges(cls, src, dst=None, labels=None):
+        '''
+        Build a graph from integer edge arrays (or an iterable of pairs); see
+        NodeMapping.from_edges
+        '''
+        graph = cls.__new__(cls)
+        graph.node_mapping = NodeMapping.from_edges(src, dst, labels=labels)
+
+        return graph
+
     def update_node_mapping(self, **kwargs):
         self.node_mapping.update()
 
-    def add_node(self, node=None, parents=None, children=None, **kwargs):
-        parent_nodes = NodeSet(parents)
-        child_nodes  = NodeSet(children)
+    def batch(self):
+        '''
+        Context manager that defers graph bookkeeping until the end of a bulk
+        edit:
 
-        self.add_children(node=node,
-                          children=child_nodes,
-                          update_node_mapping=False)
+            with graph.batch():
+                for parent, child in edges:
+                    graph.add_children(node=parent, children=[child])
+        '''
+        return self.node_mapping.batch()
 
-        for parent in parent_nodes:
-            self.add_children(node=parent,
-                              children=[node],
-                              update_node_mapping=False)
+    def add_node(self, node=None, parents=None, children=None, **kwargs):
+        with self.batch():
+            self.node_mapping.add_node(node)
 
-        self.update_node_mapping()
+            self.add_children(node=node, children=children or [])
+            self.add_parents(node=node, parents=parents or [])
 
     def add_parents(self, node=None, parents=None, **kwargs):
-        for parent in parents:
-            self.add_children(node=parent,
-                              children=node,
-                              update_node_mapping=False)
-
-        self.update_node_mapping()
+        with self.batch():
+            for parent in parents:
+                self.node_mapping.add_edge(parent, node, acyclic=True)
 
 
     def remove_parents(self, node=None, parents=None, **kwargs):
-        for parent in parents:
-            self.remove_children(node=parent,
-                                 children=[node],
-                                 update_node_mapping=False)
-
-        self.update_node_mapping()
-
-    def add_children(self, node=None, children=None, update_node_mapping=True, **kwargs):
-        node_mapping = self.node_mapping
-
-        if node not in node_mapping:
-            node_mapping[node] = NodeSet(children)
-        else:
-            child_nodes = node_mapping[node]
-
-            for child_node in child_nodes:
-                child_nodes.add(children)
-
-        if update_node_mapping:
-            self.update_node_mapping()
-
-    def remove_children(self, node=None, children=None, update_node_mapping=True, **kwargs):
-        node_mapping = self.node_mapping
+        with self.batch():
+            for parent in parents:
+                self.node_mapping.remove_edge(parent, node)
 
-        child_nodes = node_mapping[node]
-
-        for this_child in children:
-            if this_child in child_nodes:
-                child_nodes.remove(this_child)
+    def add_children(self, node=None, children=None, **kwargs):
+        '''
+        Add edges from node to each child. Raises CycleError (before adding
+        the offending edge) if an edge would create a cycle.
+        '''
+        with self.batch():
+            for child in children:
+                self.node_mapping.add_edge(node, child, acyclic=True)
 
-        if update_node_mapping:
-            self.update_node_mapping()
+    def remove_children(self, node=None, children=None, **kwargs):
+        with self.batch():
+            for child in children:
+                self.node_mapping.remove_edge(node, child)
 
 
     def has_cycles(self):
         cycles = self.node_mapping.find_cycles()
 
-        return len(cycles) > 0
+        return cycles is not None
 
 
     # TODO: printing functions (to be able to view the graph)
@@ -333,26 +836,859 @@ class DiGraph(bases.PrettyReprBaseClass):
 
 #%%
 
+class DAGExecutionError(RuntimeError):
+    '''
+    Raised by DataDAG.run when one or more nodes fail
+
+    .failures maps each failed node to its exception, .outputs holds the
+    outputs of the nodes that did complete
+    '''
+    def __init__(self, failures, outputs):
+        self.failures = failures
+        self.outputs = outputs
+
+        failed_str = obj_list_to_str(failures)
+        super().__init__(f'{len(failures)} node(s) failed: {failed_str}')
+
+
+def nodes_from_components(mapping):
+    '''
+    Convert a {component:[child components]} mapping to a {Node:NodeSet}
+    mapping, connecting each new Node to its component.
+
+    Each new node is labelled with component.label if it is set, and
+    otherwise with the class name and the number of components of that class
+    seen before it in mapping (e.g. Add_0, Add_1), so labels are the same
+    every time the same mapping is built. Keys/values that are already Node
+    objects are passed through unchanged.
+    '''
+    node_dict = {}
+    class_counts = collections.Counter()
+    labels = set()
+
+    def to_node(obj):
+        if isinstance(obj, Node):
+            return obj
+
+        if obj not in node_dict:
+            label = getattr(obj, 'label', None)
+            if label is None:
+                cls = obj.__class__.__name__
+                label = f'{cls}_{class_counts[cls]}'
+                class_counts[cls] += 1
+
+            if label in labels:
+                raise ValueError(f'more than one node labelled {label!r}')
+            labels.add(label)
+
+            node = Node(label=label)
+            node.connect_to_object(obj)
+            node_dict[obj] = node
+
+        return node_dict[obj]
+
+    node_mapping = {}
+    for key, vals in mapping.items():
+        node = to_node(key)
+        node_mapping[node] = NodeSet(*[to_node(val) for val in vals])
+
+    return node_mapping
+
+
+def _by_label(nodes):
+    # a fixed order, so that inputs built from several parents are the same
+    # in every process (and so have the same ResultCache keys)
+    return sorted(nodes, key=lambda node: str(node.label))
+
+
 class DataDAG:
 
     def __init__(self, node_mapping=None, **kwargs):
+        node_mapping = nodes_from_components(node_mapping)
+
         self.digraph = DiGraph(node_mapping=node_mapping)
         assert not self.digraph.has_cycles()
 
-    def set_inputs(self, **kwargs):
-        pass
+        self.inputs = None
+        self.outputs = {}
 
-        #
+    def set_inputs(self, inputs=None, **kwargs):
+        '''
+        Set the inputs given to every node that has no parents
+        '''
+        self.inputs = inputs if inputs is not None else kwargs
 
 
     def set_outputs(self, **kwargs):
         pass
 
-    def run(self, **kwargs):
+    def node_for(self, target):
+        '''
+        Return the node for target, which may be a Node, a component in the
+        DAG, or a node label
+        '''
+        node_mapping = self.digraph.node_mapping
+        if isinstance(target, Node) and target in node_mapping:
+            return target
+
+        for node in node_mapping.nodes:
+            if getattr(node, 'obj', None) is target or node.label == target:
+                return node
+
+        raise KeyError(target)
+
+    def ancestors(self, targets):
+        '''
+        Return the set of target nodes and everything upstream of them
+        '''
         node_mapping = self.digraph.node_mapping
 
-        # call component.run() for each component whose parents' .run() is complete
-        # probably some async thing?
+        stack = [self.node_for(target) for target in targets]
+        needed = set(stack)
+
+        while stack:
+            for parent in node_mapping.parents(stack.pop()):
+                if parent not in needed:
+                    needed.add(parent)
+                    stack.append(parent)
+
+        return needed
+
+    def compile(self):
+        '''
+        Return an ExecutionPlan for the DAG as it is now, for running it
+        repeatedly without redoing the graph analysis
+        '''
+        return ExecutionPlan(self)
+
+    def lazy_outputs(self, *args, **kwargs):
+        '''
+        Return a LazyOutputs mapping, which runs only what's needed for each
+        output the first time it is looked up (args and kwargs go to .run)
+        '''
+        return LazyOutputs(self, *args, **kwargs)
+
+    def _node_inputs(self, node, outputs):
+        '''
+        A node with no parents gets the DAG inputs, a node with one parent gets
+        that parent's outputs, and a node with several parents gets a dict of
+        {parent label: parent outputs}, in label order (see
+        nodes_from_components)
+        '''
+        parents = self.digraph.node_mapping.parents(node)
+
+        if not parents:
+            return self.inputs
+
+        if len(parents) == 1:
+            parent, = parents
+            return _resolve(outputs[parent])
+
+        return {parent.label: _resolve(outputs[parent])
+                for parent in _by_label(parents)}
+
+    def _stale_nodes(self, args, kwargs):
+        '''
+        Nodes that an incremental run has to rerun: those whose component is
+        dirty, root nodes whose inputs or run arguments changed, and
+        everything downstream of those
+        '''
+        node_mapping = self.digraph.node_mapping
+        stale = set()
+
+        for node in node_mapping.topological_order():
+            obj = getattr(node, 'obj', None)
+            parents = node_mapping.parents(node)
+
+            if obj is None or any(parent in stale for parent in parents):
+                stale.add(node)
+            elif bases.needs_rerun(obj, self.inputs, args, kwargs,
+                                   check_inputs=not parents):
+                stale.add(node)
+
+        return stale
+
+    def _submit(self, executor, node, outputs, args, kwargs, reuse=False,
+                timed=False, cores=None, profiler=None):
+        inputs = self._node_inputs(node, outputs)
+        obj = getattr(node, 'obj', None)
+
+        if obj is None or reuse:
+            future = concurrent.futures.Future()
+            future.set_result(inputs if obj is None else obj.outputs)
+            return future
+
+        if isinstance(executor, workers.WorkerPool):
+            fn, fn_args = executor.warm(obj), (inputs,)
+        else:
+            fn, fn_args = bases.run_component, (obj, inputs)
+
+        if cores is not None:
+            fn, fn_args = resources.call_limited, (fn, cores) + fn_args
+
+        if profiler is not None:
+            # returns (result, records from a process worker)
+            fn_args = (fn, time.time(), profiler.worker_copy()) + fn_args
+            fn = profiling.profiled_call
+
+        if timed:
+            # timed in the worker, so queueing isn't counted
+            return executor.submit(scheduling.timed_call, fn, *fn_args, *args,
+                                   **kwargs)
+
+        return executor.submit(fn, *fn_args, *args, **kwargs)
+
+    def _ranks(self, in_degree, history, stale):
+        '''
+        Return {node: estimated seconds from starting node to the end of the
+        run} for the scheduled nodes, using the runtimes in history
+        '''
+        node_mapping = self.digraph.node_mapping
+
+        costs = scheduling.node_costs(in_degree, history,
+                                      skip=set(in_degree) - stale)
+
+        return scheduling.upward_ranks(node_mapping.topological_order(),
+                                       node_mapping.children, costs)
+
+    def estimate_makespan(self, workers=None, history=None, targets=None):
+        '''
+        Predict the wall time in seconds of a run on workers workers (default:
+        one per CPU), by simulating the scheduler with the runtimes recorded
+        in history (see utils.scheduling). Components that have never been
+        timed are assumed to take the average recorded runtime.
+        '''
+        node_mapping = self.digraph.node_mapping
+        history = scheduling.history_for(history)
+
+        in_degree, _ = self._initial_in_degrees(targets)
+        costs = scheduling.node_costs(in_degree, history)
+
+        return scheduling.simulate_makespan(node_mapping.topological_order(),
+                                            node_mapping.parents,
+                                            node_mapping.children, costs,
+                                            workers or os.cpu_count())
+
+    def _initial_in_degrees(self, targets=None):
+        '''
+        Return {node: number of parents} and the list of nodes with none,
+        limited to the targets and their ancestors if targets are given
+        '''
+        node_mapping = self.digraph.node_mapping
+
+        if targets is None:
+            nodes = node_mapping.nodes
+        else:
+            nodes = self.ancestors(targets)
+
+        in_degree = {node: len(node_mapping.parents(node)) for node in nodes}
+        ready = [node for node, degree in in_degree.items() if degree == 0]
+
+        return in_degree, ready
+
+    def _finish_node(self, node, outputs, in_degree, ready):
+        '''
+        Record that node completed, and add the children whose parents have
+        now all completed to ready
+        '''
+        # results from a process pool come back as copies
+        obj = getattr(node, 'obj', None)
+        if obj is not None:
+            obj.outputs = outputs[node]
+
+        for child in self.digraph.node_mapping.children(node):
+            # not needed for the requested targets
+            if child not in in_degree:
+                continue
+
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                ready.append(child)
+
+    def _release_counts(self, in_degree, targets, keep):
+        '''
+        Return {node: number of consumers still to finish} for the nodes whose
+        outputs a run with release=True may drop. The targets (or the final
+        nodes, if there are none), the nodes in keep, and nodes whose
+        components set keep_outputs aren't included.
+        '''
+        node_mapping = self.digraph.node_mapping
+
+        kept = {self.node_for(target) for target in keep}
+        if targets is not None:
+            kept.update(self.node_for(target) for target in targets)
+
+        remaining = {}
+        for node in in_degree:
+            num_children = sum(child in in_degree
+                               for child in node_mapping.children(node))
+
+            if num_children == 0 or node in kept:
+                continue
+            if getattr(getattr(node, 'obj', None), 'keep_outputs', False):
+                continue
+
+            remaining[node] = num_children
+
+        return remaining
+
+    def _release_parents(self, node, outputs, remaining, budget=None):
+        '''
+        Record that node has consumed its parents' outputs, and drop the
+        outputs that have no consumers left (deleting them from disk if
+        budget spilled them)
+        '''
+        obj = getattr(node, 'obj', None)
+        if obj is not None:
+            obj.inputs = None
+
+        for parent in self.digraph.node_mapping.parents(node):
+            if parent not in remaining:
+                continue
+
+            remaining[parent] -= 1
+            if remaining[parent] == 0:
+                del remaining[parent]
+                del outputs[parent]
+
+                parent_obj = getattr(parent, 'obj', None)
+                if parent_obj is None:
+                    continue
+
+                reference = parent_obj._outputs
+                value = reference._value[0]
+
+                if bases.release_outputs(parent_obj) and budget is not None:
+                    budget.discard(reference, value)
+
+    def _check_failures(self, failures, outputs):
+        self.outputs = outputs
+
+        if failures:
+            first_exc = next(iter(failures.values()))
+            raise DAGExecutionError(failures, outputs) from first_exc
+
+    def run(self, *args, backend='thread', max_workers=None, executor=None,
+            incremental=False, targets=None, release=False, keep=(),
+            memory_budget=None, history=None, resource_budget=None,
+            **kwargs):
+        '''
+        Call component.run() for each component whose parents' .run() is
+        complete.
+
+        Every node whose parents have finished is dispatched onto a thread or
+        process pool (backend='thread'/'process'/'serial', or an existing
+        executor such as a WorkerPool), and children are released as soon as
+        their last parent completes. If a node fails, nothing downstream of
+        it is scheduled; independent branches still run, and
+        DAGExecutionError is raised at the end.
+
+        With incremental=True, only dirty components (never run, or
+        reconfigured), root components whose inputs or run arguments changed,
+        and everything downstream of them are rerun; the other nodes reuse
+        their outputs from the previous run.
+
+        With targets (nodes, components or node labels), only those nodes and
+        their ancestors are run.
+
+        With release=True, each node's outputs are dropped (from the result
+        and from its component) as soon as the last node consuming them has
+        finished, so intermediate results don't all stay in memory until the
+        end of the run. The targets (or the final nodes), the nodes in keep,
+        and components with keep_outputs set are kept.
+
+        memory_budget (a number of bytes, or a spilling.MemoryBudget) caps
+        the memory held by node outputs during the run: past it, the least
+        recently needed ones are spilled to disk and read back when a child
+        needs them. A BudgetedOutputs mapping is then returned instead of a
+        dict, which leaves spilled outputs on disk until they are looked up.
+
+        When more nodes are ready than there are workers, the one with the
+        longest estimated path to the end of the graph starts first. Runtime
+        estimates come from history (a scheduling.RuntimeHistory, or the one
+        set by scheduling.set_runtime_history), which is updated and saved
+        after the run; without one, every component counts the same.
+
+        With resource_budget (a resources.ResourceBudget, or True for the
+        whole machine), a node only starts when its component's declared
+        cores, memory_bytes and exclusive_io fit alongside the running ones;
+        lower-priority nodes that fit may go first. Process workers cap their
+        BLAS/OpenMP threads at the component's cores (which needs
+        threadpoolctl, see resources.limit_threads).
+
+        Returns a dict of {node: outputs}
+        '''
+        in_degree, ready = self._initial_in_degrees(targets)
+        budget = spilling.as_budget(memory_budget)
+
+        if release:
+            remaining = self._release_counts(in_degree, targets, keep)
+
+        if incremental:
+            stale = self._stale_nodes(args, kwargs)
+        else:
+            stale = set(in_degree)
+
+        history = scheduling.history_for(history)
+        ranks = self._ranks(in_degree, history, stale)
+
+        outputs = {}
+        failures = {}
+        running = {}
+
+        own_executor = executor is None
+        if own_executor:
+            executor = looping.make_executor(backend, max_workers)
+
+        capacity = scheduling.executor_capacity(executor)
+        profiler = profiling.active_profiler()
+
+        resource_budget = resources.as_resource_budget(resource_budget)
+        limit_threads = (resource_budget is not None
+                         and looping._uses_processes(executor))
+        held = {}
+
+        queued = scheduling.ReadyQueue(resource_budget)
+
+        if isinstance(executor, workers.WorkerPool):
+            # register everything up front, so the workers restart at most once
+            for node in in_degree:
+                obj = getattr(node, 'obj', None)
+                if obj is not None:
+                    executor.warm(obj)
+
+        try:
+            while ready or queued or running:
+                for node in ready:
+                    queued.push(node, ranks[node])
+                ready = []
+
+                while queued and (capacity is None or len(running) < capacity):
+                    node = queued.pop()
+                    if node is None:
+                        break
+
+                    obj = getattr(node, 'obj', None)
+                    cores = None
+                    if resource_budget is not None:
+                        held[node] = resources.resources_of(obj)
+                        resource_budget.acquire(held[node])
+
+                        if limit_threads:
+                            cores = held[node].cores
+
+                    if budget is not None:
+                        for parent in self.digraph.node_mapping.parents(node):
+                            if isinstance(outputs[parent], bases.DataReference):
+                                budget.touch(outputs[parent])
+
+                    future = self._submit(executor, node, outputs, args, kwargs,
+                                          reuse=node not in stale,
+                                          timed=history is not None,
+                                          cores=cores, profiler=profiler)
+                    running[future] = node
+
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    node = running.pop(future)
+                    obj = getattr(node, 'obj', None)
+
+                    if node in held:
+                        resource_budget.release(held.pop(node))
+
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        failures[node] = exc
+                        continue
+
+                    submitted = obj is not None and node in stale
+
+                    if history is not None and submitted:
+                        result, seconds = result
+                        history.record(obj, seconds)
+
+                    if profiler is not None and submitted:
+                        result, records = result
+                        profiler.add(records)
+
+                    outputs[node] = result
+                    self._finish_node(node, outputs, in_degree, ready)
+
+                    if obj is not None and node in stale:
+                        is_root = not self.digraph.node_mapping.parents(node)
+                        bases.mark_clean(obj, self.inputs, args, kwargs,
+                                         check_inputs=incremental and is_root)
+
+                    # before the budget sees the new outputs, so parents
+                    # that are done with aren't spilled just to be dropped
+                    if release:
+                        self._release_parents(node, outputs, remaining,
+                                              budget)
+
+                    if budget is not None and obj is not None:
+                        # hold the outputs through the component's reference,
+                        # which the budget can spill
+                        obj.inputs = None
+                        outputs[node] = obj._outputs
+                        budget.add(obj._outputs)
+        finally:
+            if own_executor:
+                executor.shutdown()
+
+        if history is not None:
+            history.save()
+
+        if budget is not None:
+            outputs = BudgetedOutputs(outputs)
+
+        self._check_failures(failures, outputs)
+
+        return outputs
+
+    async def arun(self, *args, max_concurrency=None, targets=None,
+                   release=False, keep=(), **kwargs):
+        '''
+        Coroutine version of run: every node runs as a task on the running
+        event loop, through component.arun. Components with a native async
+        arun don't tie up a thread while they wait; plain .run methods are
+        offloaded to threads. max_concurrency caps the number of nodes
+        running at once. targets, release and keep work as for run.
+
+        Returns a dict of {node: outputs}
+        '''
+        import asyncio
+
+        in_degree, ready = self._initial_in_degrees(targets)
+
+        if release:
+            remaining = self._release_counts(in_degree, targets, keep)
+
+        outputs = {}
+        failures = {}
+        running = {}
+
+        if max_concurrency is None:
+            limit = contextlib.nullcontext()
+        else:
+            limit = asyncio.Semaphore(max_concurrency)
+
+        async def run_node(node):
+            inputs = self._node_inputs(node, outputs)
+            obj = getattr(node, 'obj', None)
+
+            if obj is None:
+                return inputs
+
+            async with limit:
+                return await bases.arun_component(obj, inputs, *args, **kwargs)
+
+        try:
+            while ready or running:
+                for node in ready:
+                    running[asyncio.ensure_future(run_node(node))] = node
+                ready = []
+
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    node = running.pop(task)
+
+                    try:
+                        outputs[node] = task.result()
+                    except Exception as exc:
+                        failures[node] = exc
+                        continue
+
+                    self._finish_node(node, outputs, in_degree, ready)
+
+                    if release:
+                        self._release_parents(node, outputs, remaining)
+        finally:
+            # only non-empty if we were cancelled
+            for task in running:
+                task.cancel()
+
+        self._check_failures(failures, outputs)
+
+        return outputs
+
+
+class ExecutionPlan:
+    '''
+    Immutable, precomputed schedule for a DataDAG (see DataDAG.compile).
+
+    Compiling does the graph work once: the topological order, the level
+    sets (nodes whose parents are all in earlier levels, and so can run in
+    parallel), each node's parent positions, and each component's bound run
+    method. Each node's inputs are passed to it explicitly on every run, so
+    compiling doesn't change the components or how DataDAG.run behaves.
+
+    plan.run(inputs) then only dispatches component work, level by level.
+    Incremental runs, targets, output release and memory budgets are only
+    available through DataDAG.run. Changes to the DAG's graph after
+    compiling aren't seen by the plan.
+
+    The executor a run creates is kept for later runs with the same backend
+    and max_workers, so repeated runs don't restart their workers. close()
+    shuts it down, as does using the plan as a context manager:
+
+    with dag.compile() as plan:
+        for inputs in many_inputs:
+            plan.run(inputs, backend='process')
+    '''
+    def __init__(self, dag):
+        node_mapping = dag.digraph.node_mapping
+        order = node_mapping.topological_order()
+        position = {node: pos for pos, node in enumerate(order)}
+
+        parents = []
+        depths = []
+        for node in order:
+            node_parents = tuple(position[parent] for parent in
+                                 _by_label(node_mapping.parents(node)))
+            parents.append(node_parents)
+            depths.append(max((depths[pos] for pos in node_parents),
+                              default=-1) + 1)
+
+        levels = [[] for _ in range(max(depths, default=-1) + 1)]
+        for pos, depth in enumerate(depths):
+            levels[depth].append(pos)
+
+        objs = tuple(getattr(node, 'obj', None) for node in order)
+
+        self._nodes = tuple(order)
+        self._parents = tuple(parents)
+        self._levels = tuple(tuple(level) for level in levels)
+        self._objs = objs
+        self._runs = tuple(None if obj is None else obj.run for obj in objs)
+        self._labels = tuple(node.label for node in order)
+
+        # {(backend, max_workers): executor}, created on first use
+        self._executors = {}
+        self._executors_lock = threading.Lock()
+
+    def __repr__(self):
+        cls = self.__class__.__name__
+        return f'{cls}({len(self._nodes)} nodes, {len(self._levels)} levels)'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''
+        Shut down the executors created by earlier runs (a later run creates
+        a new one)
+        '''
+        with self._executors_lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+
+        for executor in executors:
+            executor.shutdown()
+
+    def _get_executor(self, backend, max_workers):
+        with self._executors_lock:
+            key = (backend, max_workers)
+
+            if key not in self._executors:
+                self._executors[key] = looping.make_executor(backend,
+                                                             max_workers)
+
+            return self._executors[key]
+
+    def _discard_executor(self, executor):
+        # e.g. a process pool whose worker died can't run anything else
+        with self._executors_lock:
+            for key, value in list(self._executors.items()):
+                if value is executor:
+                    del self._executors[key]
+
+        executor.shutdown(wait=False)
+
+    @property
+    def order(self):
+        return self._nodes
+
+    @property
+    def levels(self):
+        return tuple(tuple(self._nodes[pos] for pos in level)
+                     for level in self._levels)
+
+    def _inputs(self, pos, values, inputs):
+        parents = self._parents[pos]
+
+        if not parents:
+            return inputs
+
+        if len(parents) == 1:
+            return values[parents[0]]
+
+        return {self._labels[parent]: values[parent] for parent in parents}
+
+    def _submit(self, executor, pos, values, inputs, args, kwargs):
+        node_inputs = self._inputs(pos, values, inputs)
+        obj = self._objs[pos]
+
+        if obj is None:
+            future = concurrent.futures.Future()
+            future.set_result(node_inputs)
+            return future
+
+        return executor.submit(bases.run_bound, obj, self._runs[pos],
+                               node_inputs, args, kwargs)
+
+    def run(self, inputs=None, *args, backend='thread', max_workers=None,
+            executor=None, **kwargs):
+        '''
+        Run every component once on inputs, a level at a time. Levels with a
+        single node run in the calling thread; wider levels are dispatched
+        onto the executor (if not given, the plan's own executor for
+        backend/max_workers, which is kept for later runs until close()).
+
+        As with DataDAG.run, a failed node's descendants are skipped and
+        DAGExecutionError is raised at the end.
+
+        Returns a dict of {node: outputs}
+        '''
+        values = [None] * len(self._nodes)
+        failed = set()
+        failures = {}
+
+        serial = looping.SerialExecutor()
+        own_executor = executor is None
+
+        for level in self._levels:
+            runnable = []
+            for pos in level:
+                if failed.isdisjoint(self._parents[pos]):
+                    runnable.append(pos)
+                else:
+                    failed.add(pos)
+
+            if len(runnable) > 1 and executor is None:
+                executor = self._get_executor(backend, max_workers)
+
+            level_executor = serial if len(runnable) == 1 else executor
+
+            pending = []
+            for pos in runnable:
+                future = self._submit(level_executor, pos, values, inputs,
+                                      args, kwargs)
+                pending.append((pos, future))
+
+            for pos, future in pending:
+                try:
+                    values[pos] = future.result()
+                except Exception as exc:
+                    failures[self._nodes[pos]] = exc
+                    failed.add(pos)
+
+                    if (own_executor and executor is not None and
+                            isinstance(exc, concurrent.futures.BrokenExecutor)):
+                        self._discard_executor(executor)
+                        executor = None
+                    continue
+
+                # results from a process pool come back as copies
+                obj = self._objs[pos]
+                if obj is not None:
+                    obj.outputs = values[pos]
+
+        outputs = {node: values[pos] for pos, node in enumerate(self._nodes)
+                   if pos not in failed}
+
+        if failures:
+            first_exc = next(iter(failures.values()))
+            raise DAGExecutionError(failures, outputs) from first_exc
+
+        return outputs
+
+
+def _resolve(outputs):
+    '''
+    Node outputs are held in their component's DataReference when running
+    under a memory budget
+    '''
+    if isinstance(outputs, bases.DataReference):
+        return outputs.value
+
+    return outputs
+
+
+class BudgetedOutputs(collections.abc.Mapping):
+    '''
+    Read-only {node: outputs} mapping returned by DataDAG.run under a memory
+    budget. Outputs that were spilled stay on disk, and are loaded each time
+    they are looked up (arrays memory-mapped), so returning them doesn't
+    undo the budget.
+    '''
+    def __init__(self, outputs):
+        # the outputs as they were at the end of the run, spilled or not
+        self._values = {node: val._value[0]
+                        if isinstance(val, bases.DataReference) else val
+                        for node, val in outputs.items()}
+
+    def __getitem__(self, node):
+        value = self._values[node]
+
+        if isinstance(value, spilling.SpilledValue):
+            return value.load()
+
+        return value
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def is_spilled(self, node):
+        return isinstance(self._values[node], spilling.SpilledValue)
+
+
+class LazyOutputs(collections.abc.Mapping):
+    '''
+    Read-only {node: outputs} mapping over a DataDAG that computes outputs on
+    first access. Looking up a node (or its component or label) runs just that
+    node and its ancestors; ancestors that already ran for an earlier lookup
+    are reused rather than rerun (see DataDAG.run(incremental=True)).
+    '''
+    def __init__(self, dag, *args, **kwargs):
+        self.dag = dag
+        self._args = args
+        self._kwargs = kwargs
+        self._outputs = {}
+
+    def __getitem__(self, target):
+        node = self.dag.node_for(target)
+
+        if node not in self._outputs:
+            outputs = self.dag.run(*self._args, targets=[node],
+                                   incremental=True, **self._kwargs)
+            # spilled outputs (under a memory_budget) stay on disk
+            self._outputs.update(getattr(outputs, '_values', outputs))
+
+        value = self._outputs[node]
+        if isinstance(value, spilling.SpilledValue):
+            return value.load()
+
+        return value
+
+    def __iter__(self):
+        return iter(self.dag.digraph.node_mapping)
+
+    def __len__(self):
+        return len(self.dag.digraph.node_mapping)
+
+    def is_computed(self, target):
+        return self.dag.node_for(target) in self._outputs
 
 
 #%%
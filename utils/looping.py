@@ -6,5 +6,225 @@ Created on Thu Jan  2 22:13:09 2020
 @author: dh
 """
 
-def map_parallel(inputs=None, functions=None, **kwargs):
-    pass
\ No newline at end of file
+import time
+import contextlib
+import concurrent.futures
+
+import updawg.utils.sharing as sharing
+import updawg.utils.resources as resources
+import updawg.utils.profiling as profiling
+
+
+class SerialExecutor(concurrent.futures.Executor):
+    '''
+    Executor that runs each call as soon as it is submitted, in the calling
+    thread. Useful for debugging (breakpoints, tracebacks, profilers).
+    '''
+    def submit(self, fn, /, *args, **kwargs):
+        future = concurrent.futures.Future()
+
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as exc:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+        return future
+
+
+class MapParallelError(RuntimeError):
+    '''
+    Raised by map_parallel when one of the functions fails. The original
+    exception is chained as __cause__, and .function is the failing function.
+    '''
+    def __init__(self, function, exc):
+        self.function = function
+
+        super().__init__(f'{function!r} raised {exc!r}')
+
+
+def make_executor(backend='thread', max_workers=None, initializer=None,
+                  initargs=()):
+    '''
+    Create a concurrent.futures executor for the named backend
+    ('thread', 'process' or 'serial'). initializer(*initargs) is called once
+    in each worker as it starts.
+    '''
+    if backend == 'serial':
+        if initializer is not None:
+            initializer(*initargs)
+        return SerialExecutor()
+
+    if backend == 'thread':
+        return concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                     initializer=initializer,
+                                                     initargs=initargs)
+
+    if backend == 'process':
+        return concurrent.futures.ProcessPoolExecutor(max_workers=max_workers,
+                                                      initializer=initializer,
+                                                      initargs=initargs)
+
+    raise ValueError(f'unknown backend {backend!r}')
+
+
+def _call_chunk(functions, inputs, args, kwargs, cores=None):
+    '''
+    Call each function on inputs, stopping at the first failure. With cores,
+    BLAS/OpenMP threads are capped at that many (see resources.limit_threads).
+
+    Returns (results, exception), where exception is None if every call
+    succeeded. The exception is returned rather than raised so that the caller
+    can tell which function failed.
+    '''
+    inputs = sharing.open_shared(inputs)
+    results = []
+
+    if cores is None:
+        limiter = contextlib.nullcontext()
+    else:
+        limiter = resources.limit_threads(cores)
+
+    with limiter:
+        for function in functions:
+            try:
+                results.append(function(inputs, *args, **kwargs))
+            except Exception as exc:
+                return results, exc
+
+    return results, None
+
+
+def _submit_chunk(executor, chunk, inputs, args, kwargs, cores=None):
+    profiler = profiling.active_profiler()
+
+    if profiler is not None:
+        # the result comes back as (result, worker records)
+        return executor.submit(profiling.profiled_call, _call_chunk,
+                               time.time(), profiler.worker_copy(), chunk,
+                               inputs, args, kwargs, cores)
+
+    return executor.submit(_call_chunk, chunk, inputs, args, kwargs, cores)
+
+
+def _submit_packed(executor, functions, inputs, args, kwargs, budget,
+                   limit_threads=False):
+    '''
+    Submit one _call_chunk per function, starting each one (in order, but
+    letting later functions that fit go ahead of one that doesn't) only when
+    its declared resources fit in budget. Returns the futures once they have
+    all finished.
+    '''
+    needs = [resources.resources_of(function) for function in functions]
+    futures = [None] * len(functions)
+    waiting = list(range(len(functions)))
+    running = {}
+
+    while waiting or running:
+        for idx in list(waiting):
+            if not budget.fits(needs[idx]):
+                continue
+
+            budget.acquire(needs[idx])
+            waiting.remove(idx)
+
+            cores = needs[idx].cores if limit_threads else None
+            future = _submit_chunk(executor, [functions[idx]], inputs, args,
+                                   kwargs, cores)
+            futures[idx] = future
+            running[future] = idx
+
+        done, _ = concurrent.futures.wait(
+            running, return_when=concurrent.futures.FIRST_COMPLETED)
+
+        for future in done:
+            budget.release(needs[running.pop(future)])
+
+    return futures
+
+
+def _uses_processes(executor):
+    if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        return True
+
+    # e.g. a WorkerPool
+    return getattr(executor, 'backend', None) == 'process'
+
+
+def map_parallel(inputs=None, functions=None, args=(), backend='thread',
+                 max_workers=None, chunksize=1, executor=None,
+                 share_inputs=None, resource_budget=None, **kwargs):
+    '''
+    Call function(inputs, *args, **kwargs) for each function, in parallel,
+    and return the results in the same order as functions.
+
+    backend is 'thread', 'process' or 'serial' (run everything in the calling
+    thread, for debugging); an existing executor can be passed instead. With
+    chunksize > 1, functions are sent to the workers in groups of that size,
+    which cuts per-task overhead for process pools.
+
+    With share_inputs (the default for process workers), large array and
+    DataFrame inputs are written once to shared memory and the workers get
+    read-only views of them instead of pickled copies (see utils.sharing).
+
+    With resource_budget (a resources.ResourceBudget, or True for the whole
+    machine), each function is only started when its declared resources
+    (e.g. a component's cores and memory_bytes) fit in what the running ones
+    leave free, and process workers cap their BLAS/OpenMP threads to match
+    (which needs threadpoolctl, see resources.limit_threads).
+    chunksize is then ignored.
+
+    If a function raises, MapParallelError is raised naming that function.
+    '''
+    functions = list(functions or [])
+    resource_budget = resources.as_resource_budget(resource_budget)
+
+    if resource_budget is not None:
+        chunksize = 1
+
+    chunks = [functions[k:k+chunksize]
+              for k in range(0, len(functions), chunksize)]
+
+    own_executor = executor is None
+    if own_executor:
+        executor = make_executor(backend, max_workers)
+
+    if share_inputs is None:
+        share_inputs = _uses_processes(executor)
+
+    try:
+        with contextlib.ExitStack() as stack:
+            if share_inputs:
+                inputs = stack.enter_context(sharing.share(inputs))
+
+            if resource_budget is not None:
+                futures = _submit_packed(executor, functions, inputs, args,
+                                         kwargs, resource_budget,
+                                         limit_threads=_uses_processes(executor))
+            else:
+                futures = [_submit_chunk(executor, chunk, inputs, args, kwargs)
+                           for chunk in chunks]
+
+            # don't remove the shared inputs while a worker may still need them
+            concurrent.futures.wait(futures)
+
+        profiler = profiling.active_profiler()
+
+        outputs = []
+        for chunk, future in zip(chunks, futures):
+            if profiler is not None:
+                (results, exc), records = future.result()
+                profiler.add(records)
+            else:
+                results, exc = future.result()
+
+            if exc is not None:
+                raise MapParallelError(chunk[len(results)], exc) from exc
+
+            outputs.extend(results)
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+    return outputs
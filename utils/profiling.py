@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Opt-in per-component profiling.
+
+While a Profiler is active, every component run (through run_component, so
+DataPipeline, DataManagerParallel, DataDAG and compiled plans) is recorded
+with its wall time, CPU time, the worker (process/thread) that ran it, how
+long it waited in the executor's queue, and the estimated sizes of its
+inputs and outputs. Runs in process workers are sent back with the results.
+
+Usage:
+
+with using_profiler() as profiler:
+    pipeline.run()
+
+print(profiler.summary())
+profiler.to_chrome_trace('trace.json')     # chrome://tracing or Perfetto
+
+When no profiler is active, the only cost is one global lookup per run.
+
+A MemoryProfiler (using_profiler(MemoryProfiler())) also records memory use
+per run through tracemalloc and the process RSS; see MemoryProfiler.report.
+"""
+
+import os
+import json
+import time
+import weakref
+import threading
+import functools
+import contextlib
+import tracemalloc
+
+import updawg.utils.common as common
+
+
+_profiler = None
+
+# per-thread time at which the current call was submitted to an executor
+_state = threading.local()
+
+
+def active_profiler():
+    '''
+    The active Profiler, if it belongs to this process (a forked worker
+    inherits its parent's, which it can't report to)
+    '''
+    profiler = _profiler
+
+    if profiler is None or profiler.pid != os.getpid():
+        return None
+
+    return profiler
+
+
+def set_profiler(profiler):
+    global _profiler
+    _profiler = profiler
+
+
+@contextlib.contextmanager
+def using_profiler(profiler=None, sizes=True):
+    '''
+    Profile component runs in the block, with profiler or a new Profiler
+    '''
+    if profiler is None:
+        profiler = Profiler(sizes=sizes)
+
+    previous = _profiler
+    set_profiler(profiler)
+
+    try:
+        yield profiler
+    finally:
+        set_profiler(previous)
+        profiler.close()
+
+
+def profiled_call(fn, queued_at, worker_profiler, /, *args, **kwargs):
+    '''
+    Call fn (which runs components) in an executor worker, recording
+    queued_at (the time.time() it was submitted) as the start of the queue
+    wait. In a process worker the runs are profiled with worker_profiler
+    (see Profiler.worker_copy).
+
+    Returns (result, records), where records are the runs that were recorded
+    locally and still need to be added to the caller's Profiler.
+    '''
+    profiler = active_profiler()
+    local = profiler is None
+
+    if local:
+        profiler = worker_profiler
+        set_profiler(profiler)
+
+    _state.queued_at = queued_at
+
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        _state.queued_at = None
+
+        if local:
+            set_profiler(None)
+            profiler.close()
+
+    return result, (profiler.records if local else [])
+
+
+def _worker_name():
+    return f'{os.getpid()}/{threading.current_thread().name}'
+
+
+class Profiler:
+    '''
+    Collects one record (a dict) per component run; see the module docstring.
+    With sizes=False, input and output sizes aren't estimated.
+    '''
+    def __init__(self, sizes=True):
+        self.sizes = sizes
+        self.records = []
+        self.pid = os.getpid()
+
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        cls = self.__class__.__name__
+        return f'{cls}({len(self.records)} runs)'
+
+    def _settings(self):
+        return dict(sizes=self.sizes)
+
+    def __getstate__(self):
+        # only the settings are sent to a worker
+        return self._settings()
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def worker_copy(self):
+        '''
+        New profiler with the same settings, for a process worker
+        '''
+        return self.__class__(**self._settings())
+
+    def close(self):
+        pass
+
+    def add(self, records):
+        with self._lock:
+            self.records.extend(records)
+
+    def _start(self, component, inputs):
+        queued_at = getattr(_state, 'queued_at', None)
+        _state.queued_at = None
+
+        start = time.time()
+        queue_wait = None if queued_at is None else start - queued_at
+        input_bytes = common.estimate_nbytes(inputs) if self.sizes else None
+
+        record = dict(name=component.__class__.__name__,
+                      component=repr(component),
+                      worker=_worker_name(),
+                      pid=os.getpid(),
+                      tid=threading.get_ident(),
+                      start=start,
+                      queue_wait=queue_wait,
+                      input_bytes=input_bytes)
+
+        return record, time.perf_counter(), time.thread_time()
+
+    def _finish(self, record, perf_start, cpu_start, outputs, cpu=True):
+        record['wall'] = time.perf_counter() - perf_start
+        record['cpu'] = time.thread_time() - cpu_start if cpu else None
+        record['output_bytes'] = (common.estimate_nbytes(outputs)
+                                  if self.sizes else None)
+
+        self.add([record])
+
+    def call(self, component, inputs, fn, *args, **kwargs):
+        '''
+        Return fn(*args, **kwargs), recording it as a run of component
+        '''
+        record, perf_start, cpu_start = self._start(component, inputs)
+
+        outputs = fn(*args, **kwargs)
+
+        self._finish(record, perf_start, cpu_start, outputs)
+        return outputs
+
+    async def acall(self, component, inputs, coroutine):
+        '''
+        Await coroutine, recording it as a run of component (CPU time isn't
+        known, since the work may happen in other threads)
+        '''
+        record, perf_start, cpu_start = self._start(component, inputs)
+
+        outputs = await coroutine
+
+        self._finish(record, perf_start, cpu_start, outputs, cpu=False)
+        return outputs
+
+    def summary(self):
+        '''
+        Table of runs per component class, slowest total wall time first
+        '''
+        groups = {}
+        for record in self.records:
+            groups.setdefault(record['name'], []).append(record)
+
+        def total(records, field):
+            return sum(record[field] or 0 for record in records)
+
+        rows = []
+        for name, records in groups.items():
+            rows.append((name, len(records), total(records, 'wall'),
+                         total(records, 'cpu'), total(records, 'queue_wait'),
+                         total(records, 'input_bytes'),
+                         total(records, 'output_bytes')))
+
+        rows.sort(key=lambda row: -row[2])
+
+        header = (f'{"component":<30s}{"runs":>6s}{"wall s":>10s}{"cpu s":>10s}'
+                  f'{"queue s":>10s}{"in MB":>10s}{"out MB":>10s}')
+        lines = [header, '-' * len(header)]
+
+        for name, runs, wall, cpu, wait, in_bytes, out_bytes in rows:
+            lines.append(f'{name[:29]:<30s}{runs:>6d}{wall:>10.3f}{cpu:>10.3f}'
+                         f'{wait:>10.3f}{in_bytes / 2**20:>10.2f}'
+                         f'{out_bytes / 2**20:>10.2f}')
+
+        return '\n'.join(lines)
+
+    def to_chrome_trace(self, path=None):
+        '''
+        Return the runs as a Chrome trace (the JSON object format, which
+        Perfetto also reads), and write it to path if given
+        '''
+        events = []
+        threads = {}
+
+        for record in self.records:
+            threads[(record['pid'], record['tid'])] = record['worker']
+
+            args = {key: record[key] for key in ('component', 'cpu',
+                                                 'queue_wait', 'input_bytes',
+                                                 'output_bytes', 'peak_bytes',
+                                                 'net_bytes', 'rss_after')
+                    if key in record}
+
+            events.append(dict(name=record['name'], cat='component', ph='X',
+                               ts=record['start'] * 1e6,
+                               dur=record['wall'] * 1e6,
+                               pid=record['pid'], tid=record['tid'],
+                               args=args))
+
+        for (pid, tid), worker in threads.items():
+            events.append(dict(name='thread_name', ph='M', pid=pid, tid=tid,
+                               args=dict(name=worker)))
+
+        trace = dict(traceEvents=events, displayTimeUnit='ms')
+
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(trace, f)
+
+        return trace
+
+
+def current_rss():
+    '''
+    Resident set size of this process in bytes, or None if it can't be found
+    (uses psutil if it is installed, /proc otherwise)
+    '''
+    try:
+        import psutil
+    except ImportError:
+        pass
+    else:
+        return psutil.Process().memory_info().rss
+
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def _forget_live(live, key, ref):
+    # called when a tracked component is garbage collected (its id may
+    # already have been reused for another one)
+    entry = live.get(key)
+    if entry is not None and entry[0] is ref:
+        live.pop(key, None)
+
+
+def _take_snapshot():
+    # leave out the profiler's own allocations
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+
+
+class MemoryProfiler(Profiler):
+    '''
+    Profiler that also records, for each component run, through tracemalloc:
+
+        peak_bytes      peak traced allocations during the run, above what
+                        was allocated when it started
+        net_bytes       allocations still held when it finished
+        top_sites       the top_sites source lines (file:line, bytes) that
+                        gained the most memory during the run
+
+    and the process RSS before and after (rss_before/rss_after).
+
+    It also keeps track of which component outputs are still held, and
+    remembers the largest of them at the point where traced memory was
+    highest (see live_at_peak and report).
+
+    tracemalloc slows Python allocations down noticeably, and it sees the
+    whole process, so runs overlapping in threads share their allocations;
+    use backend='serial' (or process workers) for exact attribution. It is
+    started when the first run is profiled, if it isn't already tracing, and
+    stopped again by close().
+    '''
+    def __init__(self, sizes=True, top_sites=5, frames=1):
+        super().__init__(sizes=sizes)
+
+        self.top_sites = top_sites
+        self.frames = frames
+
+        self.peak_traced = 0
+        self.live_at_peak = []
+
+        # id(component) -> (weakref to component, id(outputs), output bytes),
+        # so that tracking outputs doesn't keep them alive
+        self._live = {}
+        self._started_tracing = False
+
+    def _settings(self):
+        return dict(sizes=self.sizes, top_sites=self.top_sites,
+                    frames=self.frames)
+
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _start(self, component, inputs):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+
+        record, perf_start, cpu_start = super()._start(component, inputs)
+
+        record['rss_before'] = current_rss()
+        record['_traced_before'] = tracemalloc.get_traced_memory()[0]
+        record['_snapshot'] = _take_snapshot()
+        record['_component'] = component
+
+        tracemalloc.reset_peak()
+
+        return record, perf_start, cpu_start
+
+    def _finish(self, record, perf_start, cpu_start, outputs, cpu=True):
+        traced, peak = tracemalloc.get_traced_memory()
+        snapshot = _take_snapshot()
+
+        before = record.pop('_traced_before')
+        stats = snapshot.compare_to(record.pop('_snapshot'), 'lineno')
+        component = record.pop('_component')
+
+        record['peak_bytes'] = peak - before
+        record['net_bytes'] = traced - before
+        record['rss_after'] = current_rss()
+        record['top_sites'] = [(f'{stat.traceback[0].filename}:'
+                                f'{stat.traceback[0].lineno}', stat.size_diff)
+                               for stat in stats[:self.top_sites]
+                               if stat.size_diff > 0]
+
+        super()._finish(record, perf_start, cpu_start, outputs, cpu=cpu)
+
+        self._track_live(component, outputs, record['output_bytes'], peak)
+
+    def _track_live(self, component, outputs, nbytes, peak):
+        if nbytes is None:
+            nbytes = common.estimate_nbytes(outputs)
+
+        key = id(component)
+        ref = weakref.ref(component,
+                          functools.partial(_forget_live, self._live, key))
+
+        with self._lock:
+            self._live[key] = (ref, id(outputs), nbytes)
+
+            # what's held only needs listing again when there's a new peak
+            if peak <= self.peak_traced:
+                return
+
+            self.peak_traced = peak
+
+            live = []
+            for ref, outputs_id, held_bytes in self._live.values():
+                held = ref()
+
+                # garbage collected, released or replaced since it ran
+                if held is None or id(held._outputs._value[0]) != outputs_id:
+                    continue
+                live.append((repr(held), held_bytes))
+
+            live.sort(key=lambda item: -item[1])
+            self.live_at_peak = live[:self.top_sites]
+
+    def add(self, records):
+        super().add(records)
+
+        with self._lock:
+            for record in records:
+                # from a process worker: its outputs aren't held here
+                self.peak_traced = max(self.peak_traced,
+                                       record.get('peak_bytes', 0))
+
+    def report(self):
+        '''
+        Per-run memory table, the top allocation sites of the runs with the
+        highest peaks, and the largest outputs held at the traced peak
+        '''
+        MB = 2**20
+
+        def mb(nbytes):
+            return '' if nbytes is None else f'{nbytes / MB:.1f}'
+
+        header = (f'{"component":<40s}{"peak MB":>10s}{"net MB":>10s}'
+                  f'{"RSS MB":>10s}{"-> MB":>10s}')
+        lines = [header, '-' * len(header)]
+
+        for record in self.records:
+            lines.append(f'{record["component"][:39]:<40s}'
+                         f'{mb(record["peak_bytes"]):>10s}'
+                         f'{mb(record["net_bytes"]):>10s}'
+                         f'{mb(record["rss_before"]):>10s}'
+                         f'{mb(record["rss_after"]):>10s}')
+
+        highest = sorted(self.records, key=lambda record: -record['peak_bytes'])
+
+        lines.append('')
+        lines.append('Top allocation sites')
+        for record in highest[:self.top_sites]:
+            lines.append(f'  {record["component"]}')
+            for site, size in record['top_sites']:
+                lines.append(f'    {size / MB:>10.1f} MB  {site}')
+
+        lines.append('')
+        lines.append('Largest outputs held at peak '
+                     f'({self.peak_traced / MB:.1f} MB traced)')
+        for name, nbytes in self.live_at_peak:
+            lines.append(f'    {nbytes / MB:>10.1f} MB  {name}')
+
+        return '\n'.join(lines)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resource declarations for components, and packing them onto one machine.
+
+A component declares what one run of it needs with these attributes (class
+attributes, or set in .configure):
+
+    cores           threads it keeps busy, e.g. through multithreaded NumPy
+                    (default 1)
+    memory_bytes    peak memory it needs (default 0)
+    exclusive_io    True if it shouldn't overlap with other exclusive_io
+                    components, e.g. because it streams a lot from disk
+
+They are read into component.resources every time .configure is called.
+
+Given a ResourceBudget (the machine's cores and memory by default),
+DataDAG.run and DataManagerParallel only start a component when its
+declaration fits in what the running ones leave free. A component that
+doesn't fit even on an idle machine runs on its own. With process workers,
+each worker's BLAS/OpenMP thread pools are capped at the component's cores.
+That needs threadpoolctl: the usual environment variables are set as well,
+but a library only reads them when it is first imported, and workers have
+usually imported NumPy already (forked from the parent, or preloaded by a
+WorkerPool). Without threadpoolctl, a warning is issued when the cap can't
+be applied to a library that is already loaded.
+
+Usage:
+
+class BigSolve(DataProcessorBase):
+    cores = 8
+    memory_bytes = 20 * 2**30
+
+dag.run(backend='process', resource_budget=ResourceBudget())
+"""
+
+import os
+import sys
+import warnings
+import threading
+import contextlib
+
+
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                   'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+# modules whose thread pools are sized from THREAD_ENV_VARS when imported
+THREADED_MODULES = ('numpy', 'scipy', 'numexpr')
+
+_warned_unlimited = False
+
+
+class Resources:
+    '''
+    What one run of a component needs (see the module docstring)
+    '''
+    def __init__(self, cores=1, memory_bytes=0, exclusive_io=False):
+        assert cores >= 0 and memory_bytes >= 0
+
+        self.cores = cores
+        self.memory_bytes = memory_bytes
+        self.exclusive_io = exclusive_io
+
+    def __repr__(self):
+        cls = self.__class__.__name__
+        return (f'{cls}(cores={self.cores}, memory_bytes={self.memory_bytes}, '
+                f'exclusive_io={self.exclusive_io})')
+
+
+# e.g. a DAG node that only passes its inputs through
+NO_RESOURCES = Resources(cores=0)
+
+
+def declared_resources(component):
+    '''
+    Read component's cores/memory_bytes/exclusive_io attributes into a
+    Resources
+    '''
+    return Resources(cores=getattr(component, 'cores', 1),
+                     memory_bytes=getattr(component, 'memory_bytes', 0),
+                     exclusive_io=getattr(component, 'exclusive_io', False))
+
+
+def resources_of(obj):
+    if obj is None:
+        return NO_RESOURCES
+
+    declared = getattr(obj, 'resources', None)
+
+    return Resources() if declared is None else declared
+
+
+def total_memory():
+    '''
+    Physical memory in bytes, or None if it can't be found
+    '''
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class ResourceBudget:
+    '''
+    Cores and memory available to the components running at once (by
+    default, the whole machine), and whether exclusive I/O is taken. A
+    budget tracks what is in use, so it should be used by one run at a time.
+    '''
+    def __init__(self, cores=None, memory_bytes=None):
+        self.cores = os.cpu_count() if cores is None else cores
+        if memory_bytes is None:
+            memory_bytes = total_memory()
+
+        self.memory_bytes = memory_bytes
+
+        self.cores_used = 0
+        self.memory_used = 0
+        self.io_busy = False
+        self.num_running = 0
+
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        cls = self.__class__.__name__
+        return f'{cls}(cores={self.cores}, memory_bytes={self.memory_bytes})'
+
+    def __deepcopy__(self, memo):
+        # shared by everything that runs under it, like a WorkerPool
+        return self
+
+    def fits(self, resources):
+        with self._lock:
+            if self.num_running == 0:
+                return True
+
+            if resources.exclusive_io and self.io_busy:
+                return False
+
+            if self.cores_used + resources.cores > self.cores:
+                return False
+
+            if (self.memory_bytes is not None and
+                    self.memory_used + resources.memory_bytes > self.memory_bytes):
+                return False
+
+            return True
+
+    def acquire(self, resources):
+        with self._lock:
+            self.cores_used += resources.cores
+            self.memory_used += resources.memory_bytes
+            self.io_busy = self.io_busy or resources.exclusive_io
+            self.num_running += 1
+
+    def release(self, resources):
+        with self._lock:
+            self.cores_used -= resources.cores
+            self.memory_used -= resources.memory_bytes
+            if resources.exclusive_io:
+                self.io_busy = False
+            self.num_running -= 1
+
+
+def as_resource_budget(resource_budget):
+    '''
+    resource_budget may be a ResourceBudget, True for the whole machine, or
+    None/False for no budget
+    '''
+    if resource_budget is True:
+        return ResourceBudget()
+
+    return resource_budget or None
+
+
+@contextlib.contextmanager
+def limit_threads(cores):
+    '''
+    Cap BLAS/OpenMP thread pools at cores threads in this process (not
+    thread-safe: use it in process workers). Libraries that are already
+    loaded can only be capped through threadpoolctl; without it, only the
+    environment variables are set, for libraries imported later.
+    '''
+    cores = max(1, int(cores))
+
+    saved = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(cores)
+
+    try:
+        import threadpoolctl
+    except ImportError:
+        _warn_unlimited()
+        limiter = contextlib.nullcontext()
+    else:
+        limiter = threadpoolctl.threadpool_limits(limits=cores)
+
+    try:
+        with limiter:
+            yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _warn_unlimited():
+    global _warned_unlimited
+
+    loaded = [name for name in THREADED_MODULES if name in sys.modules]
+
+    if loaded and not _warned_unlimited:
+        _warned_unlimited = True
+        warnings.warn(f'threadpoolctl is not installed, so the thread pools of '
+                      f'{", ".join(loaded)} (already imported) are not capped '
+                      f'at the cores components declare', RuntimeWarning,
+                      stacklevel=4)
+
+
+def call_limited(fn, cores, /, *args, **kwargs):
+    '''
+    Call fn(*args, **kwargs) with the BLAS/OpenMP thread pools capped at
+    cores threads (see limit_threads)
+    '''
+    with limit_threads(cores):
+        return fn(*args, **kwargs)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Critical-path scheduling for DataDAG.
+
+A RuntimeHistory remembers how long each component took to run, keyed by
+caching.component_fingerprint (its class and configuration), and is saved
+to a local JSON file so estimates carry over between runs. DataDAG.run uses
+the estimates to start the ready node with the longest estimated path to
+the end of the graph first, so long chains aren't left waiting behind short
+branches. DataDAG.estimate_makespan simulates a run on a given number of
+workers.
+
+Usage:
+
+history = RuntimeHistory()      # ~/.cache/updawg/runtimes.json
+
+dag.run(history=history)
+dag.estimate_makespan(workers=8, history=history)
+
+or set_runtime_history(history) to use it for every DataDAG.
+"""
+
+import os
+import json
+import heapq
+import time
+import tempfile
+import threading
+import itertools
+
+import updawg.components.caching as caching
+import updawg.utils.resources as resources
+
+
+DEFAULT_HISTORY_PATH = os.path.join('~', '.cache', 'updawg', 'runtimes.json')
+
+# used for components that have never been timed, if nothing has been
+DEFAULT_SECONDS = 1.0
+
+
+class RuntimeHistory:
+    '''
+    Per-component runtimes, kept as an exponential moving average (the
+    latest run has weight smoothing). Saved to path, if given, by save().
+    '''
+    def __init__(self, path=DEFAULT_HISTORY_PATH, smoothing=0.5):
+        self.path = None if path is None else os.path.expanduser(path)
+        self.smoothing = smoothing
+
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        if self.path is not None and os.path.exists(self.path):
+            with open(self.path) as f:
+                self._entries = json.load(f)
+
+    def __repr__(self):
+        cls = self.__class__.__name__
+        return f'{cls}({self.path!r}, {len(self._entries)} entries)'
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, component, seconds):
+        key = caching.component_fingerprint(component)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                entry = dict(name=component.__class__.__name__,
+                             seconds=seconds, runs=0)
+            else:
+                entry['seconds'] += self.smoothing * (seconds - entry['seconds'])
+
+            entry['runs'] += 1
+            self._entries[key] = entry
+
+    def estimate(self, component, default=None):
+        '''
+        Estimated runtime of component in seconds, or default if it has
+        never been timed
+        '''
+        entry = self._entries.get(caching.component_fingerprint(component))
+
+        return default if entry is None else entry['seconds']
+
+    def mean(self, default=DEFAULT_SECONDS):
+        if not self._entries:
+            return default
+
+        total = sum(entry['seconds'] for entry in self._entries.values())
+        return total / len(self._entries)
+
+    def save(self):
+        if self.path is None:
+            return
+
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+
+        with self._lock:
+            entries = dict(self._entries)
+
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+_runtime_history = None
+
+
+def set_runtime_history(history):
+    '''
+    Set the RuntimeHistory used by DataDAG.run when none is passed (None to
+    turn it off)
+    '''
+    global _runtime_history
+    _runtime_history = history
+
+
+def history_for(history=None):
+    return _runtime_history if history is None else history
+
+
+def timed_call(fn, /, *args, **kwargs):
+    '''
+    Return (fn(*args, **kwargs), seconds taken)
+    '''
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+
+    return result, time.perf_counter() - start
+
+
+def node_costs(nodes, history=None, skip=()):
+    '''
+    Return {node: estimated seconds}. Nodes without a component, and those
+    in skip, cost nothing; untimed components get the history's mean.
+    '''
+    default = DEFAULT_SECONDS if history is None else history.mean()
+    costs = {}
+
+    for node in nodes:
+        obj = getattr(node, 'obj', None)
+
+        if obj is None or node in skip:
+            costs[node] = 0.0
+        elif history is None:
+            costs[node] = default
+        else:
+            costs[node] = history.estimate(obj, default)
+
+    return costs
+
+
+def upward_ranks(order, children, costs):
+    '''
+    Return {node: length of the costliest path from node to a sink}, with
+    order a topological order of the nodes in costs and children(node) their
+    children (which may include nodes outside costs, which are ignored)
+    '''
+    ranks = {}
+
+    for node in reversed(order):
+        if node not in costs:
+            continue
+
+        child_ranks = [ranks[child] for child in children(node)
+                       if child in ranks]
+        ranks[node] = costs[node] + max(child_ranks, default=0.0)
+
+    return ranks
+
+
+def simulate_makespan(order, parents, children, costs, workers):
+    '''
+    Simulate list scheduling of the nodes in costs on workers workers,
+    starting the ready node with the highest upward rank first, and return
+    the total wall time
+    '''
+    ranks = upward_ranks(order, children, costs)
+    tiebreak = itertools.count()
+
+    in_degree = {node: sum(parent in costs for parent in parents(node))
+                 for node in costs}
+
+    ready = [(-ranks[node], next(tiebreak), node)
+             for node, degree in in_degree.items() if degree == 0]
+    heapq.heapify(ready)
+
+    running = []
+    now = 0.0
+
+    while ready or running:
+        while ready and len(running) < workers:
+            _, _, node = heapq.heappop(ready)
+            heapq.heappush(running, (now + costs[node], next(tiebreak), node))
+
+        now, _, node = heapq.heappop(running)
+
+        for child in children(node):
+            if child not in in_degree:
+                continue
+
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                heapq.heappush(ready, (-ranks[child], next(tiebreak), child))
+
+    return now
+
+
+class ReadyQueue:
+    '''
+    Nodes ready to run, popped highest rank first. With a ResourceBudget,
+    pop returns the highest-ranked node whose declared resources fit (None
+    if none do). Nodes are kept in one heap per distinct declaration, so
+    this only looks at the head of each heap rather than at every node.
+    '''
+    def __init__(self, resource_budget=None):
+        self.resource_budget = resource_budget
+
+        self._heaps = {}
+        self._len = 0
+        self._tiebreak = itertools.count()
+
+    def __len__(self):
+        return self._len
+
+    def push(self, node, rank):
+        needs = None
+        if self.resource_budget is not None:
+            needs = resources.resources_of(getattr(node, 'obj', None))
+
+        key = (None if needs is None else
+               (needs.cores, needs.memory_bytes, needs.exclusive_io))
+
+        _, heap = self._heaps.setdefault(key, (needs, []))
+        heapq.heappush(heap, (-rank, next(self._tiebreak), node))
+        self._len += 1
+
+    def pop(self):
+        best_key, best_heap = None, None
+
+        for key, (needs, heap) in self._heaps.items():
+            if best_heap is not None and heap[0] >= best_heap[0]:
+                continue
+
+            if needs is None or self.resource_budget.fits(needs):
+                best_key, best_heap = key, heap
+
+        if best_heap is None:
+            return None
+
+        _, _, node = heapq.heappop(best_heap)
+        if not best_heap:
+            del self._heaps[best_key]
+
+        self._len -= 1
+        return node
+
+
+def executor_capacity(executor):
+    '''
+    Number of calls executor runs at once, or None if it runs them as they
+    are submitted
+    '''
+    max_workers = (getattr(executor, 'max_workers', None)
+                   or getattr(executor, '_max_workers', None))
+
+    if max_workers is None and hasattr(executor, 'backend'):
+        # e.g. a WorkerPool sized by the machine
+        max_workers = os.cpu_count()
+
+    return max_workers
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Zero-copy hand-off of large array inputs to process workers.
+
+Sending one big array or DataFrame to N process workers normally pickles it N
+times. share() instead writes it once to memory-mapped .npy files (under
+/dev/shm where available, so the data stays in RAM) and yields a small
+picklable handle. Workers call open_shared() on the handle to get read-only
+views onto the same pages. The files are removed when the share() block
+exits; workers that still have them open keep their mappings.
+
+Handled inputs: NumPy arrays, dicts of arrays (column-oriented data) and
+pandas DataFrames. Object-dtype columns and small inputs are passed through
+to be pickled as usual.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import contextlib
+
+
+# below this size, pickling is cheaper than creating a file
+MIN_SHARED_BYTES = 1 << 20
+
+
+def _shared_dir():
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+
+    return None
+
+
+def _is_shareable_array(obj):
+    np = sys.modules.get('numpy')
+
+    if np is None or not isinstance(obj, np.ndarray):
+        return False
+
+    return not obj.dtype.hasobject
+
+
+def _is_dataframe(obj):
+    pd = sys.modules.get('pandas')
+
+    return pd is not None and isinstance(obj, pd.DataFrame)
+
+
+class SharedArray:
+    '''
+    Handle for an array saved to a memory-mapped .npy file
+    '''
+    def __init__(self, path, shape, dtype):
+        self.path = path
+        self.shape = shape
+        self.dtype = dtype
+
+    def open(self):
+        import numpy as np
+        return np.load(self.path, mmap_mode='r')
+
+    def __repr__(self):
+        cls = self.__class__.__name__
+        return f'{cls}(shape={self.shape}, dtype={self.dtype})'
+
+
+class SharedColumns:
+    '''
+    Handle for column-oriented data (a dict of arrays or a DataFrame) whose
+    columns are SharedArray handles or, if they couldn't be shared, the
+    columns themselves
+    '''
+    def __init__(self, columns, index=None, is_dataframe=False):
+        self.columns = columns
+        self.index = index
+        self.is_dataframe = is_dataframe
+
+    def open(self):
+        columns = {key: open_shared(val) for key, val in self.columns.items()}
+
+        if not self.is_dataframe:
+            return columns
+
+        import pandas as pd
+        return pd.DataFrame(columns, index=self.index, copy=False)
+
+    def __repr__(self):
+        cls = self.__class__.__name__
+        return f'{cls}({list(self.columns)})'
+
+
+def _share_array(arr, directory):
+    import numpy as np
+
+    fd, path = tempfile.mkstemp(suffix='.npy', dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, arr)
+
+    return SharedArray(path, arr.shape, arr.dtype)
+
+
+def _share(obj, directory, min_bytes):
+    if _is_shareable_array(obj):
+        if obj.nbytes < min_bytes:
+            return obj
+        return _share_array(obj, directory)
+
+    if isinstance(obj, dict) and any(_is_shareable_array(val)
+                                     for val in obj.values()):
+        columns = {key: _share(val, directory, min_bytes)
+                   for key, val in obj.items()}
+        return SharedColumns(columns)
+
+    if _is_dataframe(obj):
+        columns = {key: _share(obj[key].to_numpy(), directory, min_bytes)
+                   for key in obj.columns}
+        return SharedColumns(columns, index=obj.index, is_dataframe=True)
+
+    return obj
+
+
+@contextlib.contextmanager
+def share(obj, min_bytes=MIN_SHARED_BYTES):
+    '''
+    Context manager that yields a picklable stand-in for obj whose large
+    arrays live in memory-mapped files; see open_shared.
+
+    Anything that can't be shared is yielded unchanged.
+    '''
+    directory = tempfile.mkdtemp(prefix='updawg-', dir=_shared_dir())
+
+    try:
+        yield _share(obj, directory, min_bytes)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def open_shared(obj):
+    '''
+    Turn a handle made by share() back into read-only arrays/DataFrames;
+    anything else is returned unchanged
+    '''
+    if isinstance(obj, (SharedArray, SharedColumns)):
+        return obj.open()
+
+    return obj
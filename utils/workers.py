@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Long-lived worker pools that can be shared across pipeline runs.
+
+Starting a process pool (and importing pandas/matplotlib in every worker)
+can cost more than the work itself for small inputs. A WorkerPool keeps its
+workers alive between runs, imports the configured modules once per worker,
+and keeps a copy of each registered component in each worker, so that later
+calls only need to send the inputs.
+
+Usage:
+
+pool = WorkerPool(backend='process', max_workers=8,
+                  preload=['pandas', 'matplotlib.pyplot'])
+
+manager = DataManagerParallel(*components, pool=pool)
+for inputs in many_inputs:
+    manager.inputs = inputs
+    manager.run()
+
+pool.shutdown()
+"""
+
+import copy
+import weakref
+import itertools
+import importlib
+import concurrent.futures
+
+from updawg.utils.looping import make_executor
+
+
+# components registered with a WorkerPool, as seen by the worker
+_worker_components = {}
+
+# keys for registered components, unique across the pools in a process (with
+# thread workers, they all share _worker_components)
+_component_keys = itertools.count()
+
+
+def _init_worker(preload, components):
+    for module_name in preload:
+        importlib.import_module(module_name)
+
+    _worker_components.update(components)
+
+
+def _forget(keys, components, component_id, key):
+    # called when a registered component is garbage collected
+    if keys.get(component_id) == key:
+        del keys[component_id]
+
+    components.pop(key, None)
+    _worker_components.pop(key, None)
+
+
+class WarmComponent:
+    '''
+    Picklable stand-in for a component registered with a WorkerPool.
+
+    Calling it runs the worker's own copy of the component (see
+    DataComponent.__call__), so only the key and the inputs are sent to the
+    worker.
+    '''
+    def __init__(self, key, description, resources=None):
+        self.key = key
+        self.description = description
+        self.resources = resources
+
+    def __call__(self, inputs, *args, **kwargs):
+        component = _worker_components[self.key]
+        return component(inputs, *args, **kwargs)
+
+    def __repr__(self):
+        return self.description
+
+
+class WorkerPool(concurrent.futures.Executor):
+    '''
+    Executor that keeps its workers (and their imports and registered
+    components) alive until shutdown() is called.
+
+    It can be passed anywhere an executor is accepted (map_parallel,
+    DataDAG.run) and to DataManagerParallel(pool=...). Workers are started on
+    the first submit, or explicitly with start().
+    '''
+    def __init__(self, backend='process', max_workers=None, preload=()):
+        self.backend = backend
+        self.max_workers = max_workers
+        self.preload = tuple(preload)
+
+        # {id(component): key} while the component is alive, and the copies
+        # of the components that are sent to the workers (with the
+        # configuration version they were taken at), by key
+        self._keys = {}
+        self._components = {}
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            components = {key: component for key, (component, _)
+                          in self._components.items()}
+            initargs = (self.preload, components)
+            self._executor = make_executor(self.backend,
+                                           self.max_workers,
+                                           initializer=_init_worker,
+                                           initargs=initargs)
+
+        return self._executor
+
+    def start(self):
+        '''
+        Start every worker now, rather than on first use
+        '''
+        executor = self._get_executor()
+        num_workers = getattr(executor, '_max_workers', 1)
+
+        futures = [executor.submit(int) for _ in range(num_workers)]
+        concurrent.futures.wait(futures)
+
+        return self
+
+    def submit(self, fn, /, *args, **kwargs):
+        return self._get_executor().submit(fn, *args, **kwargs)
+
+    def warm(self, component, refresh=False):
+        '''
+        Register component with the pool, and return a WarmComponent that
+        calls the workers' copy of it.
+
+        The workers' copy is a deep copy taken when the component is first
+        registered, with either backend. It is taken again when the component
+        has been reconfigured (through .configure) since; use refresh=True
+        after changing it in other ways. Registering a new component (or
+        refreshing one) restarts the workers. A component is unregistered
+        when it is garbage collected, or with unwarm.
+        '''
+        key = self._keys.get(id(component))
+
+        if key is None:
+            key = next(_component_keys)
+            self._keys[id(component)] = key
+            weakref.finalize(component, _forget, self._keys, self._components,
+                             id(component), key)
+
+        version = getattr(component, '_config_version', None)
+        _, warm_version = self._components.get(key, (None, None))
+
+        if refresh or key not in self._components or warm_version != version:
+            self._components[key] = (copy.deepcopy(component), version)
+            self.shutdown()
+
+        return WarmComponent(key, repr(component),
+                             getattr(component, 'resources', None))
+
+    def unwarm(self, component):
+        '''
+        Unregister component. Process workers keep their copy until they
+        next restart.
+        '''
+        key = self._keys.pop(id(component), None)
+        self._components.pop(key, None)
+        _worker_components.pop(key, None)
+
+    def resize(self, max_workers):
+        '''
+        Change the number of workers; the new workers start on next use
+        '''
+        self.max_workers = max_workers
+        self.shutdown()
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+            self._executor = None
+
+    def __deepcopy__(self, memo):
+        # a pool is a shared resource, so copies of the objects that use it
+        # (e.g. PrettyReprBaseClass kwargs) should share it too
+        return self
+
+    def __repr__(self):
+        cls = self.__class__.__name__
+        return (f'{cls}(backend={self.backend}, max_workers={self.max_workers}, '
+                f'preload={list(self.preload)})')